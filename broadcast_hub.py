@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+# --- Config ---
+MAX_PROGRESS_PER_SECOND = 4
+MAX_QUEUED_EVENTS = 256
+
+
+class ClientChannel:
+    """
+    Outgoing message queue for a single websocket client.
+    Events are delivered in order; progress updates are coalesced so only the
+    latest one is kept and sent at most MAX_PROGRESS_PER_SECOND times a second.
+    Past MAX_QUEUED_EVENTS only droppable events (progress, file cards) are
+    discarded, replies and lifecycle events always get through.
+    """
+
+    def __init__(self, websocket, max_progress_rate=MAX_PROGRESS_PER_SECOND):
+        self.websocket = websocket
+        self.min_interval = 1.0 / max_progress_rate
+        self.events = deque()
+        self.progress = None
+        self.last_progress_at = 0.0
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def push_event(self, msg, droppable=False):
+        # Pending progress is older than this event, keep it ahead in the queue
+        if self.progress is not None:
+            self._append(json.dumps(self.progress), droppable=True)
+            self.progress = None
+            self.last_progress_at = time.monotonic()
+        self._append(msg, droppable)
+        self.wakeup.set()
+
+    def _append(self, msg, droppable):
+        if len(self.events) >= MAX_QUEUED_EVENTS:
+            oldest = next((e for e in self.events if e[1]), None)
+            if oldest is not None:
+                print("Slow client, dropping oldest queued event")
+                self.events.remove(oldest)
+            elif droppable:
+                return
+        self.events.append((msg, droppable))
+
+    def push_progress(self, payload):
+        # Overwrite instead of queueing: stale progress is simply dropped
+        self.progress = payload
+        self.wakeup.set()
+
+    async def run(self):
+        try:
+            while True:
+                if self.events:
+                    msg, _ = self.events.popleft()
+                    await self.websocket.send(msg)
+                    continue
+
+                timeout = None
+                if self.progress is not None:
+                    timeout = self.last_progress_at + self.min_interval - time.monotonic()
+                    if timeout <= 0:
+                        payload, self.progress = self.progress, None
+                        self.last_progress_at = time.monotonic()
+                        await self.websocket.send(json.dumps(payload))
+                        continue
+
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Client channel closed: {e}")
+
+
+class BroadcastHub:
+    """
+    Fan-out point for everything the backend pushes to GUI clients.
+    publish() and publish_progress() never await, so callers such as the
+    embedding loop are not slowed down by slow or stalled clients.
+    """
+
+    def __init__(self, max_progress_rate=MAX_PROGRESS_PER_SECOND):
+        self.max_progress_rate = max_progress_rate
+        self.channels = {}
+
+    def register(self, websocket):
+        channel = ClientChannel(websocket, self.max_progress_rate)
+        channel.task = asyncio.create_task(channel.run())
+        self.channels[websocket] = channel
+        return channel
+
+    def unregister(self, websocket):
+        channel = self.channels.pop(websocket, None)
+        if channel and channel.task:
+            channel.task.cancel()
+
+    def publish(self, payload, droppable=False):
+        if not self.channels:
+            return
+        msg = json.dumps(payload)
+        for channel in list(self.channels.values()):
+            channel.push_event(msg, droppable)
+
+    def send(self, websocket, payload):
+        # Replies share the client's queue, so they never overtake progress sent before them
+        channel = self.channels.get(websocket)
+        if channel:
+            channel.push_event(json.dumps(payload))
+
+    def publish_progress(self, payload):
+        for channel in list(self.channels.values()):
+            channel.push_progress(payload)
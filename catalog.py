@@ -0,0 +1,233 @@
+import os
+import sqlite3
+from datetime import datetime
+
+CATALOG_DB = "catalog.db"
+
+
+def connect():
+    conn = sqlite3.connect(CATALOG_DB)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def init_catalog():
+    conn = connect()
+    c = conn.cursor()
+    # path is the primary key, so prefix range scans use its B-tree
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS folders (
+            path TEXT PRIMARY KEY,
+            root TEXT,
+            vector_id INTEGER
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_folders_vector ON folders (root, vector_id)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            folder TEXT,
+            root TEXT,
+            hash TEXT,
+            vector_id INTEGER
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_vector ON files (root, vector_id)")
+    # Write-ahead move journal: planned -> done -> undoing -> undone, or failed
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS moves (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            batch TEXT,
+            src TEXT,
+            dst TEXT,
+            state TEXT DEFAULT 'planned',
+            timestamp TEXT
+        )
+    """)
+    columns = [row[1] for row in c.execute("PRAGMA table_info(moves)")]
+    if "state" not in columns:
+        # Catalogs from before the journal only recorded finished moves
+        c.execute("ALTER TABLE moves ADD COLUMN state TEXT DEFAULT 'done'")
+        c.execute("UPDATE moves SET state = CASE WHEN undone = 1 THEN 'undone' ELSE 'done' END")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_moves_batch ON moves (batch)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_moves_state ON moves (state)")
+    conn.commit()
+    conn.close()
+
+
+def prefix_bounds(prefix):
+    # Every path under prefix/ sorts in [prefix/, prefix0) since '0' follows '/'
+    prefix = prefix.rstrip(os.sep)
+    return prefix + os.sep, prefix + chr(ord(os.sep) + 1)
+
+
+# --- Index sync ---
+def sync_shard(root, file_metadata, folder_metadata, start=0):
+    """
+    Mirrors a shard's rows into the catalog. vector_id is the row in the
+    shard's file index. start > 0 only appends the rows added since the
+    last sync, start == 0 replaces everything for the root.
+    """
+    conn = connect()
+    with conn:
+        if start == 0:
+            conn.execute("DELETE FROM files WHERE root = ?", (root,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO files (path, folder, root, hash, vector_id) VALUES (?, ?, ?, ?, ?)",
+            [
+                (e["path"], e.get("root_folder"), root, e.get("hash"), start + i)
+                for i, e in enumerate(file_metadata[start:])
+            ]
+        )
+        conn.execute("DELETE FROM folders WHERE root = ?", (root,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO folders (path, root, vector_id) VALUES (?, ?, ?)",
+            [(e["path"], root, i) for i, e in enumerate(folder_metadata)]
+        )
+    conn.close()
+
+
+def drop_root(root):
+    conn = connect()
+    with conn:
+        conn.execute("DELETE FROM files WHERE root = ?", (root,))
+        conn.execute("DELETE FROM folders WHERE root = ?", (root,))
+    conn.close()
+
+
+def current_paths(root, vector_ids, table="files"):
+    """Current on-disk path of each vector id, after any grouping moves."""
+    vector_ids = [int(v) for v in vector_ids]
+    if not vector_ids:
+        return {}
+    conn = connect()
+    rows = []
+    for i in range(0, len(vector_ids), 500):
+        batch = vector_ids[i:i + 500]
+        placeholders = ",".join("?" * len(batch))
+        rows += conn.execute(
+            f"SELECT vector_id, path FROM {table} WHERE root = ? AND vector_id IN ({placeholders})",
+            [root] + batch
+        ).fetchall()
+    conn.close()
+    return dict(rows)
+
+
+# --- Moves ---
+def _move_prefix(conn, old, new):
+    lo, hi = prefix_bounds(old)
+    cut = len(old.rstrip(os.sep)) + 1
+    # Only called once the rename succeeded, so rows still claiming the
+    # destination are stale and would collide with the moved paths
+    new_lo, new_hi = prefix_bounds(new)
+    for table in ("files", "folders"):
+        conn.execute(
+            f"DELETE FROM {table} WHERE path = ? OR (path >= ? AND path < ?)",
+            (new.rstrip(os.sep), new_lo, new_hi)
+        )
+    for table, columns in (("files", ("path", "folder")), ("folders", ("path",))):
+        for column in columns:
+            conn.execute(
+                f"UPDATE {table} SET {column} = ? || substr({column}, ?) "
+                f"WHERE {column} = ? OR ({column} >= ? AND {column} < ?)",
+                (new.rstrip(os.sep), cut, old.rstrip(os.sep), lo, hi)
+            )
+
+
+def plan_moves(batch, moves):
+    """
+    Journals a whole move plan as planned before anything is renamed,
+    so an interrupted grouping can be finished. Returns the moves with ids.
+    """
+    conn = connect()
+    planned = []
+    with conn:
+        for move in moves:
+            cur = conn.execute(
+                "INSERT INTO moves (batch, src, dst, state, timestamp) VALUES (?, ?, ?, 'planned', ?)",
+                (batch, move["from"], move["to"], datetime.now().isoformat())
+            )
+            planned.append({**move, "id": cur.lastrowid})
+    conn.close()
+    return planned
+
+
+def complete_move(move_id, src, dst):
+    """
+    Applies a finished folder move to every catalogued path under src and
+    marks it done, in one transaction.
+    """
+    conn = connect()
+    with conn:
+        _move_prefix(conn, src, dst)
+        conn.execute("UPDATE moves SET state = 'done' WHERE id = ?", (move_id,))
+    conn.close()
+
+
+def _set_state(move_ids, state):
+    move_ids = list(move_ids)
+    conn = connect()
+    with conn:
+        conn.executemany("UPDATE moves SET state = ? WHERE id = ?", [(state, i) for i in move_ids])
+    conn.close()
+
+
+def fail_move(move_id):
+    _set_state([move_id], "failed")
+
+
+def plan_undo(move_ids):
+    _set_state(move_ids, "undoing")
+
+
+def cancel_undo(move_id):
+    # Folder is still at its grouped location, so the move stays undoable
+    _set_state([move_id], "done")
+
+
+def interrupted_moves():
+    """Journaled moves whose grouping or undo never finished, oldest first."""
+    conn = connect()
+    rows = conn.execute(
+        "SELECT id, batch, src, dst, state FROM moves WHERE state IN ('planned', 'undoing') ORDER BY id"
+    ).fetchall()
+    conn.close()
+    return [
+        {"id": move_id, "batch": batch, "src": src, "dst": dst, "state": state}
+        for move_id, batch, src, dst, state in rows
+    ]
+
+
+def latest_batch():
+    conn = connect()
+    row = conn.execute(
+        "SELECT batch FROM moves WHERE state = 'done' ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def reverse_plan(batch=None):
+    """
+    Exact undo plan for a grouping batch (latest by default): its moves
+    that are not undone yet, newest first, as {"id", "from", "to"}.
+    """
+    batch = batch or latest_batch()
+    if batch is None:
+        return None, []
+    conn = connect()
+    rows = conn.execute(
+        "SELECT id, src, dst FROM moves WHERE batch = ? AND state = 'done' ORDER BY id DESC",
+        (batch,)
+    ).fetchall()
+    conn.close()
+    return batch, [{"id": move_id, "from": dst, "to": src} for move_id, src, dst in rows]
+
+
+def record_undo(move_id, src, dst):
+    """Moves catalogued paths back and marks the move as undone."""
+    conn = connect()
+    with conn:
+        _move_prefix(conn, src, dst)
+        conn.execute("UPDATE moves SET state = 'undone' WHERE id = ?", (move_id,))
+    conn.close()
@@ -1,54 +1,176 @@
 import os
 import json
+import threading
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
+from index_roots import load_roots, shard_paths
+from catalog import current_paths
 
-FILE_INDEX = "file_index.faiss"
-FILE_METADATA = "file_metadata.jsonl"
-UNDO_LOG_PATH = "undo_log.json"
+FOLDER_CANDIDATES = 5
+FILE_NEIGHBOURS = 10
+REJECT_DISTANCE = 2.0  # squared L2 of orthogonal unit vectors, queries and indexed vectors are normalized
+MIN_CONFIDENCE = 0.2
 
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
+_model = None
+_model_lock = threading.Lock()
+_shard_cache = {}
+_shard_lock = threading.Lock()
 
-def load_undo_map():
-    if not os.path.exists(UNDO_LOG_PATH):
-        return {}
-    with open(UNDO_LOG_PATH) as f:
-        entries = json.load(f)
-    return {entry["to"]: entry["from"] for entry in entries}
 
+def get_model():
+    # Loaded on first use, so embedding worker processes never load it
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = SentenceTransformer(MODEL_NAME)
+    return _model
 
-def resolve_grouped_path(original_path, undo_map):
-    current = original_path
-    while current != "/":
-        if current in undo_map:
-            relative = os.path.relpath(original_path, current)
-            return os.path.join(undo_map[current], relative)
-        current = os.path.dirname(current)
-    return original_path
 
+def index_vectors(index):
+    # Zero-copy view of a flat index's vectors
+    try:
+        return faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+    except AttributeError:
+        return index.reconstruct_n(0, index.ntotal)
 
-def classify_text(content):
-    if not content.strip():
-        return "Uncategorized"
 
-    vec = model.encode(content).astype("float32").reshape(1, -1)
+def load_shard(root, kind="file"):
+    """
+    Index, metadata and per-folder row ids of a shard, cached until the
+    shard's index file changes on disk.
+    """
+    paths = shard_paths(root)
+    index_path = paths[f"{kind}_index"]
+    metadata_path = paths[f"{kind}_metadata"]
+    if not (os.path.exists(index_path) and os.path.exists(metadata_path)):
+        return None
+    stamp = (os.path.getmtime(index_path), os.path.getmtime(metadata_path))
 
-    try:
-        index = faiss.read_index(FILE_INDEX)
-        with open(FILE_METADATA, "r") as f:
+    with _shard_lock:
+        cached = _shard_cache.get((root, kind))
+        if cached and cached["stamp"] == stamp:
+            return cached
+
+        index = faiss.read_index(index_path)
+        with open(metadata_path, "r") as f:
             metadata = [json.loads(line) for line in f]
+        shard = {"stamp": stamp, "index": index, "metadata": metadata, "vectors": None, "rows": {}}
+        if kind == "file" and index.ntotal == len(metadata):
+            rows = {}
+            for i, entry in enumerate(metadata):
+                rows.setdefault(entry.get("root_folder"), []).append(i)
+            shard["rows"] = {folder: np.array(ids, dtype="int64") for folder, ids in rows.items()}
+            shard["vectors"] = index_vectors(index)
+        _shard_cache[(root, kind)] = shard
+        return shard
+
+
+def search_shards(vec, k, kind="file", roots=None):
+    """
+    Searches every root's shard and merges the per-shard top-k by distance.
+    Returns a list of (distance, metadata entry, root, vector id), nearest first.
+    """
+    results = []
+    for root in roots or load_roots():
+        shard = load_shard(root, kind)
+        if shard is None or shard["index"].ntotal == 0:
+            continue
+        D, I = shard["index"].search(vec, min(k, shard["index"].ntotal))
+        for dist, idx in zip(D[0], I[0]):
+            if 0 <= idx < len(shard["metadata"]):
+                results.append((float(dist), shard["metadata"][idx], root, int(idx)))
+    results.sort(key=lambda r: r[0])
+    return results[:k]
+
+
+def search_files_in_folders(vec, k, folder_paths, roots=None):
+    """
+    k nearest files restricted to the given top-level folders. Only the
+    candidate folders' vectors are compared, not the whole file index.
+    Same (distance, metadata entry, root, vector id) results as search_shards.
+    """
+    results = []
+    for root in roots or load_roots():
+        shard = load_shard(root, "file")
+        if shard is None or shard["vectors"] is None:
+            continue
+        ids = [shard["rows"][f] for f in folder_paths if f in shard["rows"]]
+        if not ids:
+            continue
+        ids = np.concatenate(ids)
+        # Shards indexed before vectors were normalized hold shorter ones
+        candidates = shard["vectors"][ids]
+        faiss.normalize_L2(candidates)
+        dists = ((candidates - vec) ** 2).sum(axis=1)
+        nearest = np.argsort(dists)[:k] if len(dists) <= k else np.argpartition(dists, k)[:k]
+        for j in nearest:
+            results.append((float(dists[j]), shard["metadata"][ids[j]], root, int(ids[j])))
+    results.sort(key=lambda r: r[0])
+    return results[:k]
+
 
-        D, I = index.search(vec, 1)
-        closest_file_path = metadata[I[0][0]]["path"]
-        parent_folder = os.path.dirname(closest_file_path)
+def classify_ranked(content, top_n=3):
+    """
+    Two-stage classification: route against the folder indexes to pick
+    candidate folders, then let the k nearest files inside them vote,
+    weighted by distance. Returns [{"category", "confidence"}], best first.
+    """
+    if not content.strip():
+        return []
+
+    vec = np.ascontiguousarray(get_model().encode(content), dtype="float32").reshape(1, -1)
+    faiss.normalize_L2(vec)
+
+    candidates = [r[1]["path"] for r in search_shards(vec, FOLDER_CANDIDATES, kind="folder")]
+    if candidates:
+        neighbours = search_files_in_folders(vec, FILE_NEIGHBOURS, candidates)
+    else:
+        # No folder index yet, fall back to searching every file
+        neighbours = search_shards(vec, FILE_NEIGHBOURS)
+    if not neighbours:
+        return []
+
+    # Indexed paths go stale when grouping moves folders, the catalog has the current ones
+    current = {}
+    for root in {r[2] for r in neighbours}:
+        ids = [r[3] for r in neighbours if r[2] == root]
+        current[root] = current_paths(root, ids)
+
+    votes = {}
+    for dist, entry, root, vector_id in neighbours:
+        # Linear kernel: an exact match counts 1, anything past REJECT_DISTANCE counts 0
+        weight = max(0.0, 1.0 - dist / REJECT_DISTANCE)
+        path = current[root].get(vector_id, entry["path"])
+        category = os.path.dirname(path)
+        votes[category] = votes.get(category, 0.0) + weight
 
-        undo_map = load_undo_map()
-        resolved_path = resolve_grouped_path(parent_folder, undo_map)
+    ranked = [
+        {"category": category, "confidence": round(weight / len(neighbours), 3)}
+        for category, weight in votes.items()
+    ]
+    ranked.sort(key=lambda r: r["confidence"], reverse=True)
+    return ranked[:top_n]
 
-        return resolved_path
 
+def classify_with_candidates(content):
+    """
+    (category, ranked candidates). The category is "Uncategorized" when
+    classification fails or the best candidate is below MIN_CONFIDENCE.
+    """
+    try:
+        ranked = classify_ranked(content)
     except Exception as e:
         print("Failed to classify with embedding:", e)
-        return "Uncategorized"
+        return "Uncategorized", []
+
+    if not ranked or ranked[0]["confidence"] < MIN_CONFIDENCE:
+        return "Uncategorized", ranked
+    return ranked[0]["category"], ranked
+
+
+def classify_text(content):
+    return classify_with_candidates(content)[0]
@@ -0,0 +1,190 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from index_roots import load_roots, shard_paths
+
+# --- Config ---
+CONTENT_STORE_DIR = "content_store"
+VECTORS_FILE = os.path.join(CONTENT_STORE_DIR, "vectors.f32")
+BLOBS_FILE = os.path.join(CONTENT_STORE_DIR, "blobs.jsonl")
+EMBEDDING_DIM = 384
+HASH_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+HASH_READ_SIZE = 1024 * 1024
+
+
+# --- Hashing ---
+def hash_file(path):
+    # Plain buffered reads: mmap would not save the copy (slices are bytes anyway),
+    # and a file truncated by a sync client while mapped kills the process (SIGBUS)
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                # hashlib releases the GIL on large updates, so threads hash in parallel
+                h.update(block)
+    except (OSError, ValueError):
+        pass
+    return h.hexdigest()
+
+
+def hash_files(paths, workers=HASH_WORKERS):
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(hash_file, paths)))
+
+
+# --- Content-addressed vectors ---
+class ContentStore:
+    """
+    Embedding vectors keyed by content hash, stored once no matter how many
+    paths share that content. Rows are appended to a flat float32 file and
+    indexed by blobs.jsonl.
+    """
+
+    def __init__(self, directory=CONTENT_STORE_DIR):
+        self.directory = directory
+        self.vectors_file = os.path.join(directory, os.path.basename(VECTORS_FILE))
+        self.blobs_file = os.path.join(directory, os.path.basename(BLOBS_FILE))
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.chunks = {}
+        self.vectors = np.zeros((0, EMBEDDING_DIM), dtype="float32")
+        self.row_count = 0
+        self.recent = {}
+        self.pending = []
+        self.load()
+
+    def _map_vectors(self):
+        if not os.path.exists(self.vectors_file):
+            return
+        row_bytes = EMBEDDING_DIM * 4
+        size = os.path.getsize(self.vectors_file)
+        if size % row_bytes:
+            # Drop a partially written trailing row so appends stay aligned
+            with open(self.vectors_file, "r+b") as f:
+                f.truncate(size - size % row_bytes)
+            size -= size % row_bytes
+        if size == 0:
+            return
+        # Memory-mapped, so a large store is never read into memory as a whole
+        self.vectors = np.memmap(self.vectors_file, dtype="float32", mode="r").reshape(-1, EMBEDDING_DIM)
+
+    def load(self):
+        self._map_vectors()
+        self.row_count = len(self.vectors)
+        if not os.path.exists(self.blobs_file):
+            return
+        valid_bytes = 0
+        with open(self.blobs_file, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated line")
+                    blob = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-flush; anything after it is unreadable too
+                    print(f"Dropping partial line at byte {valid_bytes} of {self.blobs_file}")
+                    break
+                valid_bytes += len(line)
+                # Ignore rows whose vector never made it to disk
+                if blob["row"] < self.row_count:
+                    self.rows[blob["hash"]] = blob["row"]
+                    self.chunks[blob["hash"]] = blob.get("chunks", 1)
+        if valid_bytes < os.path.getsize(self.blobs_file):
+            # Cut it off so the next append starts on a fresh line
+            with open(self.blobs_file, "r+b") as f:
+                f.truncate(valid_bytes)
+
+    def __contains__(self, content_hash):
+        return content_hash in self.rows
+
+    def get(self, content_hash):
+        with self.lock:
+            if content_hash in self.recent:
+                return self.recent[content_hash]
+            row = self.rows.get(content_hash)
+            if row is None:
+                return None
+            return np.array(self.vectors[row], dtype="float32")
+
+    def get_chunks(self, content_hash):
+        return self.chunks.get(content_hash, 1)
+
+    def put(self, content_hash, vector, chunks=1):
+        with self.lock:
+            if content_hash in self.rows:
+                return
+            self.rows[content_hash] = self.row_count
+            self.row_count += 1
+            self.chunks[content_hash] = chunks
+            self.recent[content_hash] = np.asarray(vector, dtype="float32")
+            self.pending.append(content_hash)
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            new_vectors = np.vstack([self.recent[h] for h in self.pending]).astype("float32")
+            # Vectors first: a blob line is only trusted once its row exists
+            with open(self.vectors_file, "ab") as f:
+                new_vectors.tofile(f)
+            with open(self.blobs_file, "a") as f:
+                for content_hash in self.pending:
+                    f.write(json.dumps({
+                        "hash": content_hash,
+                        "row": self.rows[content_hash],
+                        "chunks": self.chunks[content_hash]
+                    }) + "\n")
+            self._map_vectors()
+            for content_hash in self.pending:
+                del self.recent[content_hash]
+            self.pending = []
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = ContentStore()
+    return _store
+
+
+# --- Duplicates ---
+def find_duplicates(roots=None):
+    """
+    Groups every hashed file across all shards by content hash.
+    Returns groups with more than one path, largest wasted space first.
+    """
+    by_hash = {}
+    for root in roots or load_roots():
+        hashes_file = shard_paths(root)["file_hashes"]
+        if not os.path.exists(hashes_file):
+            continue
+        with open(hashes_file, "r") as f:
+            for line in f:
+                entry = json.loads(line)
+                if not os.path.exists(entry["path"]):
+                    continue
+                group = by_hash.setdefault(entry["hash"], {"size": entry.get("size", 0), "paths": []})
+                if entry["path"] not in group["paths"]:
+                    group["paths"].append(entry["path"])
+
+    duplicates = []
+    for content_hash, group in by_hash.items():
+        if len(group["paths"]) < 2 or group["size"] == 0:
+            continue
+        duplicates.append({
+            "hash": content_hash,
+            "size": group["size"],
+            "paths": sorted(group["paths"]),
+            "wasted_bytes": group["size"] * (len(group["paths"]) - 1)
+        })
+    duplicates.sort(key=lambda d: d["wasted_bytes"], reverse=True)
+    return duplicates
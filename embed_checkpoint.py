@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import uuid
+from datetime import datetime
+
+# --- Config ---
+CHECKPOINT_FILE = "embedding_checkpoint.json"
+
+
+class RunCheckpoint:
+    """
+    Durable record of what an embedding run has committed to its shards:
+    finished folders per root, files already written for the folder in
+    progress, and the progress totals so a resumed run continues the bar.
+    """
+
+    def __init__(self, state=None, resumed=False):
+        self.resumed = resumed
+        self.state = state or {
+            "run_id": uuid.uuid4().hex,
+            "started": datetime.now().isoformat(),
+            "roots": {},
+            "progress": {}
+        }
+
+    # --- Root state ---
+    def start_root(self, root, folders):
+        if root not in self.state["roots"]:
+            self.state["roots"][root] = {
+                "folders": list(folders),
+                "completed_folders": [],
+                "current_folder": None,
+                "committed_files": []
+            }
+        return self.state["roots"][root]
+
+    def roots(self):
+        return {root: s["folders"] for root, s in self.state["roots"].items()}
+
+    def completed_folders(self, root):
+        return set(self.state["roots"].get(root, {}).get("completed_folders", []))
+
+    def committed_files(self, root, folder):
+        root_state = self.state["roots"].get(root, {})
+        if root_state.get("current_folder") != folder:
+            return set()
+        return set(root_state.get("committed_files", []))
+
+    def commit_files(self, root, folder, paths):
+        root_state = self.state["roots"][root]
+        root_state["current_folder"] = folder
+        root_state["committed_files"] = list(paths)
+
+    def complete_folder(self, root, folder):
+        root_state = self.state["roots"][root]
+        if folder not in root_state["completed_folders"]:
+            root_state["completed_folders"].append(folder)
+        root_state["current_folder"] = None
+        root_state["committed_files"] = []
+
+    # --- Progress ---
+    def record_progress(self, tracker):
+        self.state["progress"] = {
+            "total_files": tracker.total_files,
+            "total_bytes": tracker.total_bytes,
+            "done_files": tracker.done_files,
+            "done_bytes": tracker.done_bytes,
+            "elapsed": time.monotonic() - tracker.started
+        }
+
+    def restore_progress(self, tracker):
+        progress = self.state.get("progress") or {}
+        tracker.total_files = progress.get("total_files", tracker.total_files)
+        tracker.total_bytes = progress.get("total_bytes", tracker.total_bytes)
+        tracker.done_files = progress.get("done_files", 0)
+        tracker.done_bytes = progress.get("done_bytes", 0)
+        # Shift the start so throughput and ETA carry on from the previous run
+        tracker.started = time.monotonic() - progress.get("elapsed", 0)
+
+    # --- Persistence ---
+    def save(self, tracker=None):
+        if tracker is not None:
+            self.record_progress(tracker)
+        self.state["updated"] = datetime.now().isoformat()
+        tmp_path = CHECKPOINT_FILE + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, CHECKPOINT_FILE)
+
+
+def load_checkpoint():
+    if not os.path.exists(CHECKPOINT_FILE):
+        return None
+    try:
+        with open(CHECKPOINT_FILE, "r") as f:
+            return RunCheckpoint(json.load(f), resumed=True)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable checkpoint: {e}")
+        return None
+
+
+def clear_checkpoint():
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
@@ -0,0 +1,268 @@
+import os
+import time
+import queue
+import asyncio
+import multiprocessing as mp
+from collections import OrderedDict
+from embedding_state import embedding_cancel_event
+
+# --- Config ---
+POLL_INTERVAL = 0.2
+SAMPLE_INTERVAL = 0.5
+MAX_RETRIES = 1  # a file that kills a second worker is given up on
+
+
+class EmbedderUnavailable(RuntimeError):
+    """No worker is left to embed with, the run has to stop."""
+
+
+def default_threads(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def worker_environment(threads):
+    return {
+        "OMP_NUM_THREADS": str(threads),
+        "MKL_NUM_THREADS": str(threads),
+        "TOKENIZERS_PARALLELISM": "false"
+    }
+
+
+def worker_main(worker_id, threads, tasks, results, cancel, batch_size):
+    """
+    Worker process: loads its own model with a pinned thread count, then
+    extracts and embeds job paths, streaming one result per file back.
+    batch_size is shared with the coordinator's memory budget and read per file.
+    """
+    # Buffered results are useless once the run is closing, never block exit on them
+    results.cancel_join_thread()
+
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    import folder_embed_and_classify as fe
+    from extractor import extract_text
+
+    # One device per process: several processes sharing an accelerator just contend
+    fe.DEVICE = torch.device("cpu")
+    fe.model.to(fe.DEVICE)
+    print(f"[Worker {worker_id}] ready with {threads} threads")
+
+    while True:
+        paths = tasks.get()
+        if paths is None:
+            break
+        for path in paths:
+            if cancel.is_set():
+                results.put((worker_id, path, None))
+                continue
+            text = ""
+            try:
+                text = extract_text(path)
+                if text.strip():
+                    result = fe._embed_text_sync(text, max(1, batch_size.value), cancel_event=cancel)
+                else:
+                    result = None
+            except Exception as e:
+                print(f"[Worker {worker_id}] failed on {path}: {e}")
+                result = None
+            results.put((worker_id, path, result))
+            del text
+
+
+class ProcessEmbedder:
+    """
+    Spreads extraction and inference over worker processes. The coordinator
+    (embed_root) keeps ownership of the FAISS indexes, metadata and
+    checkpoint; workers only stream (path, (vector, chunks)) back.
+    Same interface as LocalEmbedder.
+
+    Submitted paths wait in a coordinator-side backlog. Each worker only
+    holds 1 + budget.read_ahead paths at a time, and reads the budget's
+    batch size per file, so a tightened budget takes effect right away.
+    Every worker has its own task queue, so the paths in flight on each one
+    are known exactly. If a worker dies (e.g. OOM-killed) its unfinished
+    paths go back to the front of the backlog for the survivors; once none
+    are left, pending and later requests raise EmbedderUnavailable.
+    """
+
+    def __init__(self, workers, budget, threads_per_worker=None):
+        self.workers = workers
+        self.budget = budget
+        self.threads = threads_per_worker or default_threads(workers)
+        self.lookahead = workers * 2
+
+        ctx = mp.get_context("spawn")
+        self.tasks = [ctx.Queue() for _ in range(workers)]
+        self.results = ctx.Queue()
+        self.cancel = ctx.Event()
+        self.batch_size = ctx.Value("i", budget.batch_size, lock=False)
+        self.procs = [
+            ctx.Process(
+                target=worker_main,
+                args=(i, self.threads, self.tasks[i], self.results, self.cancel, self.batch_size),
+                daemon=True
+            )
+            for i in range(workers)
+        ]
+        self.alive = set(range(workers))
+        self.inflight = {i: {} for i in range(workers)}
+        self.backlog = OrderedDict()
+        self.retries = {}
+        self.futures = {}
+        self.reader = None
+        self.closing = False
+
+    def start(self):
+        # Spawned children re-import the main module's imports (torch among them)
+        # before worker_main runs, so thread limits go in through the inherited
+        # environment instead of being set inside the worker
+        env = worker_environment(self.threads)
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            for proc in self.procs:
+                proc.start()
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        self.reader = asyncio.create_task(self._read_results())
+        print(f"Started {self.workers} embedding workers with {self.threads} threads each")
+
+    def _future(self, path):
+        if path not in self.futures:
+            self.futures[path] = asyncio.get_running_loop().create_future()
+        return self.futures[path]
+
+    def _dispatch(self):
+        # Top every live worker up to its share of the read-ahead budget
+        capacity = 1 + self.budget.read_ahead
+        for worker in sorted(self.alive, key=lambda w: len(self.inflight[w])):
+            free = capacity - len(self.inflight[worker])
+            if free <= 0 or not self.backlog:
+                continue
+            job = [self.backlog.popitem(last=False)[0] for _ in range(min(free, len(self.backlog)))]
+            self.inflight[worker].update(dict.fromkeys(job))
+            self.tasks[worker].put(job)
+
+    def submit(self, paths):
+        for path in paths:
+            self._future(path)
+            self.backlog[path] = None
+        if self.alive:
+            self._dispatch()
+        else:
+            self._fail_pending(EmbedderUnavailable("All embedding workers have exited"))
+
+    def discard(self, path):
+        self.backlog.pop(path, None)
+        future = self.futures.pop(path, None)
+        if future and not future.done():
+            future.cancel()
+
+    async def get(self, path):
+        if self.reader is None or self.reader.done():
+            raise EmbedderUnavailable("Embedding workers are not running")
+        if path not in self.futures:
+            self.submit([path])
+        elif path in self.backlog:
+            # The caller is blocked on this one, let it jump the backlog
+            self.backlog.move_to_end(path, last=False)
+            self._dispatch()
+        future = self.futures[path]
+        try:
+            return await future
+        finally:
+            self.futures.pop(path, None)
+
+    def _resolve(self, path, result):
+        future = self.futures.get(path)
+        if future and not future.done():
+            future.set_result(result)
+
+    def _fail_pending(self, error=None):
+        # None for a stop: embed_root then sees the cancel event and breaks out
+        self.backlog.clear()
+        for future in self.futures.values():
+            if not future.done():
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    def _check_workers(self):
+        for worker in list(self.alive):
+            if self.procs[worker].is_alive():
+                continue
+            self.alive.discard(worker)
+            lost = list(self.inflight.pop(worker))
+            self.inflight[worker] = {}
+            print(f"Embedding worker {worker} exited with code {self.procs[worker].exitcode}, "
+                  f"{len(lost)} files in flight")
+
+            for path in reversed(lost):
+                future = self.futures.get(path)
+                if future is None or future.done():
+                    continue
+                self.retries[path] = self.retries.get(path, 0) + 1
+                if self.retries[path] > MAX_RETRIES:
+                    # Same outcome as a file the extractor or model fails on
+                    print(f"Giving up on {path} after it took down {self.retries[path]} workers")
+                    future.set_result(None)
+                else:
+                    self.backlog[path] = None
+                    self.backlog.move_to_end(path, last=False)
+
+            if not self.alive:
+                self._fail_pending(EmbedderUnavailable("All embedding workers have exited"))
+                return False
+        self._dispatch()
+        return True
+
+    async def _read_results(self):
+        last_sample = 0.0
+        try:
+            while True:
+                # Forward a stop_embedding from the socket to every worker
+                if embedding_cancel_event.is_set() and not self.cancel.is_set():
+                    self.cancel.set()
+                    self._fail_pending()
+                if not self.closing and not self._check_workers():
+                    return
+                try:
+                    worker, path, result = await asyncio.to_thread(self.results.get, True, POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                self.inflight.get(worker, {}).pop(path, None)
+                self._resolve(path, result)
+                # Summing worker RSS is not free, sample on a timer rather than per file
+                if time.monotonic() - last_sample > SAMPLE_INTERVAL:
+                    last_sample = time.monotonic()
+                    self.budget.sample()
+                    self.batch_size.value = self.budget.batch_size
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # e.g. a worker killed mid-put leaves a torn message in the results pipe
+            print(f"Embedding result reader failed: {e}")
+            self._fail_pending(EmbedderUnavailable(f"Embedding result reader failed: {e}"))
+
+    async def close(self):
+        self.closing = True
+        self.cancel.set()
+        self._fail_pending()
+        for tasks in self.tasks:
+            tasks.put(None)
+        if self.reader:
+            self.reader.cancel()
+        await asyncio.to_thread(self._join)
+
+    def _join(self):
+        for proc in self.procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
@@ -1,2 +1,5 @@
 import asyncio
+import threading
 embedding_cancel_event = asyncio.Event()
+# Set while an embedding run owns the shard files
+embedding_running = threading.Event()
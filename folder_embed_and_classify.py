@@ -1,7 +1,7 @@
 import os
 import json
-import gc
 import hashlib
+import time
 import numpy as np
 import faiss
 import torch
@@ -9,18 +9,22 @@ from tqdm import tqdm
 from extractor import extract_text
 from transformers import AutoTokenizer, AutoModel
 import asyncio
-from embedding_state import embedding_cancel_event
+from collections import deque
+from embedding_state import embedding_cancel_event, embedding_running
+from index_roots import load_roots, normalize_root, ensure_shard, write_manifest
+from content_store import get_store, hash_files
+from embed_checkpoint import RunCheckpoint, load_checkpoint, clear_checkpoint
+from memory_budget import MemoryBudget
+from embed_workers import ProcessEmbedder
+from catalog import init_catalog, sync_shard
 
 # --- Config ---
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 EMBEDDING_DIM = 384
 CHUNK_SIZE = 512
-FLUSH_INTERVAL = 10
-
-FOLDER_INDEX_FILE = "folder_index.faiss"
-FOLDER_METADATA_FILE = "folder_metadata.jsonl"
-FILE_INDEX_FILE = "file_index.faiss"
-FILE_METADATA_FILE = "file_metadata.jsonl"
+FLUSH_SECONDS = 15  # a commit rewrites the whole shard, so bound it by time, not file count
+RSS_BUDGET_MB = None  # e.g. 2048 to keep a run under 2 GB resident
+EMBED_WORKERS = 1  # >1 spreads extraction and inference over worker processes
 
 USE_MPS = torch.backends.mps.is_available()
 DEVICE = torch.device("mps" if USE_MPS else "cpu")
@@ -44,53 +48,144 @@ def clean_text(text):
     return ' '.join(text.split())
 
 
-def hash_folder(path):
+def hash_folder(path, file_hashes):
+    # Derived from the per-file content hashes, so the folder is not read twice
     h = hashlib.sha256()
-    for dirpath, _, filenames in os.walk(path):
-        for f in sorted(filenames):
-            try:
-                with open(os.path.join(dirpath, f), "rb") as file:
-                    h.update(file.read(4096))
-            except:
-                continue
+    for fpath in sorted(file_hashes):
+        h.update(os.path.relpath(fpath, path).encode("utf-8", "surrogateescape"))
+        h.update(file_hashes[fpath].encode("ascii"))
     return h.hexdigest()
 
 
-def hash_file(path):
-    h = hashlib.sha256()
+def list_files(folder_path):
+    return [
+        os.path.join(dirpath, f)
+        for dirpath, _, files in os.walk(folder_path)
+        for f in files
+    ]
+
+
+def scan_tree(folder_paths):
+    total_files = 0
+    total_bytes = 0
+    for folder_path in folder_paths:
+        for dirpath, _, files in os.walk(folder_path):
+            for f in files:
+                total_files += 1
+                try:
+                    total_bytes += os.path.getsize(os.path.join(dirpath, f))
+                except OSError:
+                    pass
+    return total_files, total_bytes
+
+
+class ProgressTracker:
+    """
+    Per-file progress with throughput and ETA for the GUI.
+    """
+
+    def __init__(self, total_files=0, total_bytes=0):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.done_files = 0
+        self.done_bytes = 0
+        self.started = time.monotonic()
+
+    def advance(self, nbytes=0):
+        self.done_files += 1
+        self.done_bytes += nbytes
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        bytes_per_sec = self.done_bytes / elapsed
+        files_per_sec = self.done_files / elapsed
+        if bytes_per_sec > 0 and self.total_bytes:
+            eta = max(self.total_bytes - self.done_bytes, 0) / bytes_per_sec
+        elif files_per_sec > 0:
+            eta = max(self.total_files - self.done_files, 0) / files_per_sec
+        else:
+            eta = None
+        return {
+            "bytes_done": self.done_bytes,
+            "bytes_total": self.total_bytes,
+            "files_per_sec": round(files_per_sec, 2),
+            "bytes_per_sec": round(bytes_per_sec),
+            "eta_seconds": round(eta) if eta is not None else None
+        }
+
+
+async def report_progress(progress_callback, tracker, final=False):
+    if not progress_callback:
+        return
+    done = tracker.total_files if final else tracker.done_files
     try:
-        with open(path, "rb") as f:
-            while chunk := f.read(4096):
-                h.update(chunk)
-    except:
-        pass
-    return h.hexdigest()
+        await progress_callback(done, tracker.total_files, **tracker.stats())
+    except Exception as e:
+        print(f"progress_callback failed: {e}")
+
+
+def iter_chunks(text):
+    for i in range(0, len(text), CHUNK_SIZE):
+        yield text[i:i + CHUNK_SIZE]
 
 
-def _embed_text_sync(text):
+def _embed_text_sync(text, batch_size=1, cancel_event=embedding_cancel_event):
     """
     Synchronous embedding function.
-    Checks embedding_cancel_event periodically to allow early termination.
+    Chunks are encoded batch_size at a time and folded into a running sum,
+    so only one batch of tensors is alive at once.
+    Checks cancel_event (embedding_cancel_event, or the pool's event inside a
+    worker process) periodically to allow early termination.
+    Returns (mean vector, chunk count) or None.
     """
-    chunks = [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
-    embeddings = []
+    total = np.zeros(EMBEDDING_DIM, dtype="float64")
+    n_chunks = 0
+    chunks = iter_chunks(text)
 
-    for chunk in chunks:
-        if embedding_cancel_event.is_set():
+    while True:
+        if cancel_event.is_set():
             print("Cancel detected inside _embed_text_sync")
             return None
 
-        formatted = format_text(clean_text(chunk), MODEL_NAME)
-        inputs = tokenizer(formatted, return_tensors="pt", truncation=True, max_length=512).to(DEVICE)
+        batch = [format_text(clean_text(c), MODEL_NAME) for _, c in zip(range(batch_size), chunks)]
+        if not batch:
+            break
+
+        inputs = tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=512).to(DEVICE)
         with torch.no_grad():
             outputs = model(**inputs)
             emb = outputs.last_hidden_state[:, 0]
             emb = torch.nn.functional.normalize(emb, p=2, dim=1)
-            embeddings.append(emb.cpu().numpy())
+            total += emb.cpu().numpy().sum(axis=0)
+        n_chunks += len(batch)
+        del inputs, outputs, emb
 
-    if not embeddings:
+    if not n_chunks:
+        return None
+    return (total / n_chunks).astype("float32"), n_chunks
+
+
+def add_unit(index, vectors):
+    # Stored vectors are means of unit chunk vectors and shorter than 1. Indexed
+    # ones are normalized, so a squared L2 distance is always 2 - 2 * cosine
+    x = np.array(vectors, dtype="float32").reshape(-1, EMBEDDING_DIM)
+    faiss.normalize_L2(x)
+    index.add(x)
+
+
+def folder_vector(entries, store):
+    total = np.zeros(EMBEDDING_DIM, dtype="float64")
+    weight = 0
+    for entry in entries:
+        vec = store.get(entry["hash"])
+        if vec is None:
+            continue
+        n = store.get_chunks(entry["hash"])
+        total += vec * n
+        weight += n
+    if not weight:
         return None
-    return np.mean(np.vstack(embeddings), axis=0).astype("float32")
+    return (total / weight).astype("float32")
 
 
 def load_cache(file):
@@ -100,10 +195,31 @@ def load_cache(file):
         return {json.loads(line)["path"]: json.loads(line) for line in f}
 
 
+def write_atomic(path, write):
+    # A crash mid-write leaves the previous file intact instead of a torn one
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
 def save_jsonl(entries, path):
-    with open(path, "w") as f:
-        for e in entries:
-            f.write(json.dumps(e) + "\n")
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            for e in entries:
+                f.write(json.dumps(e) + "\n")
+    write_atomic(path, write)
+
+
+def append_jsonl(entries, path):
+    if not entries:
+        return
+    # One write, so a crash can tear at most the last line
+    with open(path, "a") as f:
+        f.write("".join(json.dumps(e) + "\n" for e in entries))
+
+
+def save_index(index, path):
+    write_atomic(path, lambda tmp_path: faiss.write_index(index, tmp_path))
 
 
 # Async wrappers for blocking work
@@ -113,198 +229,454 @@ async def extract_text_async(path):
     return await asyncio.to_thread(extract_text, path)
 
 
-async def embed_text_async(text):
+async def embed_text_async(text, batch_size=1):
     if embedding_cancel_event.is_set():
         raise asyncio.CancelledError()
-    return await asyncio.to_thread(_embed_text_sync, text)
+    return await asyncio.to_thread(_embed_text_sync, text, batch_size)
 
 
-async def embed_folders_and_files(root_dir, progress_callback=None, broadcast_callback=None):
-    file_count = 0
-    folder_cache = load_cache(FOLDER_METADATA_FILE)
-    file_cache = load_cache(FILE_METADATA_FILE)
+def list_folders(root_dir):
+    if not os.path.isdir(root_dir):
+        print(f"Root not found, skipping: {root_dir}")
+        return []
+    return [f for f in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, f))]
+
+
+def load_jsonl(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        lines = f.read().splitlines()
+    entries = []
+    for n, line in enumerate(lines):
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            if n < len(lines) - 1:
+                raise
+            # Only an append cut short by a crash leaves a broken last line
+            print(f"[Index] Ignoring torn last line of {path}")
+    return entries
+
+
+def restore_committed(root_dir, shard, checkpoint, store):
+    """
+    Reloads what an interrupted run already committed for this root,
+    without re-walking or re-hashing the finished folders.
+    """
+    done_paths = {os.path.join(root_dir, f) for f in checkpoint.completed_folders(root_dir)}
+    root_state = checkpoint.state["roots"].get(root_dir, {})
+    current = root_state.get("current_folder")
+    committed = set(root_state.get("committed_files", []))
+
+    folder_metadata = [e for e in load_jsonl(shard["folder_metadata"]) if e["path"] in done_paths]
+    file_metadata = [
+        e for e in load_jsonl(shard["file_metadata"])
+        if (e.get("root_folder") in done_paths or e["path"] in committed) and e["hash"] in store
+    ]
+    hashed_files = [
+        e for e in load_jsonl(shard["file_hashes"])
+        if e["path"] in committed
+        or os.path.join(root_dir, os.path.relpath(e["path"], root_dir).split(os.sep)[0]) in done_paths
+    ]
+
+    print(f"Resuming {root_dir}: {len(done_paths)} folders and {len(committed)} files of "
+          f"{current or 'no folder'} already committed")
+    return folder_metadata, file_metadata, hashed_files
+
+
+class LocalEmbedder:
+    """
+    Extracts and embeds in this process. Extraction of submitted files runs
+    ahead in background threads, bounded by the budget's read-ahead depth.
+    """
+
+    lookahead = 1
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.queue = deque()
+        self.prefetch = {}
+
+    def submit(self, paths):
+        self.queue.extend(paths)
+
+    def discard(self, path):
+        task = self.prefetch.pop(path, None)
+        if task:
+            task.cancel()
+        elif path in self.queue:
+            self.queue.remove(path)
+
+    def _top_up(self):
+        while self.queue and len(self.prefetch) <= self.budget.read_ahead:
+            path = self.queue.popleft()
+            self.prefetch[path] = asyncio.create_task(extract_text_async(path))
+
+    async def get(self, path):
+        self._top_up()
+        task = self.prefetch.pop(path, None) or asyncio.create_task(extract_text_async(path))
+        try:
+            text = await task
+        except asyncio.CancelledError:
+            print("extract_text_async cancelled while embedding file.")
+            raise
+        except Exception as e:
+            print(f"extract_text failed for {path}: {e}")
+            return None
+
+        if embedding_cancel_event.is_set() or not text.strip():
+            return None
+
+        try:
+            result = await embed_text_async(text, self.budget.batch_size)
+        except asyncio.CancelledError:
+            print("embed_text_async cancelled")
+            raise
+        except Exception as e:
+            print(f"File embedding failed: {os.path.basename(path)} — {e}")
+            result = None
+        # Drop the document now rather than when the next one replaces it
+        del text
+        self.budget.sample()
+        return result
+
+    async def close(self):
+        for task in self.prefetch.values():
+            task.cancel()
+        self.prefetch.clear()
+        self.queue.clear()
+
+
+async def embed_root(root_dir, folders, tracker, progress_callback=None, checkpoint=None,
+                     budget=None, embedder=None):
+    """
+    Builds the index shard for a single root. Other shards are never touched.
+    Every flush is a commit recorded in the run checkpoint, so a later run can
+    resume from it. The embedder does extraction and inference; this
+    coroutine owns the index, metadata and checkpoint writes.
+    """
+    shard = ensure_shard(root_dir)
+    store = get_store()
+    budget = budget or MemoryBudget()
+    owns_embedder = embedder is None
+    embedder = embedder or LocalEmbedder(budget)
+    folder_cache = load_cache(shard["folder_metadata"])
+    file_cache = load_cache(shard["file_metadata"])
 
     folder_index = faiss.IndexFlatL2(EMBEDDING_DIM)
     file_index = faiss.IndexFlatL2(EMBEDDING_DIM)
 
     folder_metadata = []
     file_metadata = []
-
-    folders = [f for f in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, f))]
-    total_folders = len(folders)
-    done_folders = 0
+    hashed_files = []
+    completed = set()
+
+    if checkpoint and checkpoint.resumed:
+        completed = checkpoint.completed_folders(root_dir)
+        folder_metadata, file_metadata, hashed_files = restore_committed(root_dir, shard, checkpoint, store)
+        for entry in folder_metadata:
+            add_unit(folder_index, entry["embedding"])
+        for entry in file_metadata:
+            add_unit(file_index, store.get(entry["hash"]))
+    if checkpoint:
+        checkpoint.start_root(root_dir, folders)
+
+    synced = 0
+    commits = 0
+    last_commit = time.monotonic()
+    dirty = False  # something finished since the last commit
+    folder_files = []  # finished paths of the current folder, committed ones included
+
+    def commit(folder=None, folder_done=False):
+        nonlocal synced, commits, dirty, last_commit
+        store.flush()
+        save_jsonl(folder_metadata, shard["folder_metadata"])
+        save_index(folder_index, shard["folder_index"])
+        save_jsonl(file_metadata, shard["file_metadata"])
+        save_index(file_index, shard["file_index"])
+        save_jsonl(hashed_files, shard["file_hashes"])
+        # Rows only ever get appended during a run, so only the new ones are synced
+        sync_shard(root_dir, file_metadata, folder_metadata, start=synced)
+        synced = len(file_metadata)
+        commits += 1
+        dirty = False
+        last_commit = time.monotonic()
+        if not checkpoint or folder is None:
+            return
+        if folder_done:
+            checkpoint.complete_folder(root_dir, folder)
+        else:
+            checkpoint.commit_files(root_dir, folder, folder_files)
+        checkpoint.save(tracker)
+
+    async def finish_file(record):
+        nonlocal dirty
+        # Only fully processed files count as done, so a resume never skips one
+        hashed_files.append(record)
+        folder_files.append(record["path"])
+        dirty = True
+        tracker.advance(record["size"])
+        await report_progress(progress_callback, tracker)
+
+    async def prepare(folder):
+        folder_path = os.path.join(root_dir, folder)
+        file_paths = list_files(folder_path)
+        committed = checkpoint.committed_files(root_dir, folder) if checkpoint else set()
+        known_hashes = {e["path"]: e["hash"] for e in hashed_files if e["path"] in committed}
+        file_hashes = await asyncio.to_thread(
+            hash_files, [p for p in file_paths if p not in known_hashes]
+        )
+        file_hashes.update(known_hashes)
+
+        # Older metadata carried the vector inline, move it into the store
+        for fpath in file_paths:
+            cached = file_cache.get(fpath)
+            if cached and cached["hash"] == file_hashes[fpath] and "embedding" in cached:
+                store.put(file_hashes[fpath], np.array(cached["embedding"], dtype="float32"))
+
+        # Only content not in the store yet is handed to the embedder
+        to_embed = []
+        seen_hashes = set()
+        for fpath in file_paths:
+            fhash = file_hashes[fpath]
+            if fpath in committed or fhash in store or fhash in seen_hashes:
+                continue
+            seen_hashes.add(fhash)
+            to_embed.append(fpath)
+        embedder.submit(to_embed)
+
+        return {
+            "folder": folder,
+            "path": folder_path,
+            "files": file_paths,
+            "hashes": file_hashes,
+            "hash": hash_folder(folder_path, file_hashes),
+            "committed": committed,
+            "submitted": set(to_embed)
+        }
 
     print(f"Embedding folders & files in {root_dir}...")
 
+    folder = None
+    folder_done = False
+    remaining = deque(f for f in folders if f not in completed)
+    prepared = deque()
+    if not remaining and folders:
+        folder, folder_done = folders[-1], True
+
     try:
-        for folder in folders:
+        while remaining or prepared:
             if embedding_cancel_event.is_set():
                 print("Embedding was cancelled at folder start.")
                 break
 
-            folder_path = os.path.join(root_dir, folder)
-            folder_hash = hash_folder(folder_path)
+            # Hash and submit the next folders so the embedder always has work queued
+            while remaining and len(prepared) < embedder.lookahead:
+                prepared.append(await prepare(remaining.popleft()))
 
-            if folder_path in folder_cache and folder_cache[folder_path]["hash"] == folder_hash:
-                vec = np.array(folder_cache[folder_path]["embedding"], dtype="float32")
-                folder_index.add(np.array([vec]))
-                folder_metadata.append(folder_cache[folder_path])
-                print(f"Folder cached: {folder}")
-            else:
-                text_parts = []
-                for dirpath, _, files in os.walk(folder_path):
-                    for f in files:
-                        if embedding_cancel_event.is_set():
-                            print("Cancel detected during folder extraction.")
-                            break
-                        fpath = os.path.join(dirpath, f)
-                        try:
-                            chunk_text = await extract_text_async(fpath)
-                        except asyncio.CancelledError:
-                            print("extract_text_async cancelled")
-                            raise
-                        except Exception as e:
-                            print(f"extract_text failed for {fpath}: {e}")
-                            chunk_text = ""
-                        if embedding_cancel_event.is_set():
-                            print("Cancel detected right after extract_text.")
-                            break
-                        if chunk_text:
-                            text_parts.append(chunk_text)
-                    if embedding_cancel_event.is_set():
-                        break
+            current = prepared.popleft()
+            folder = current["folder"]
+            folder_path = current["path"]
+            folder_done = False
+            committed = current["committed"]
+            folder_files = [p for p in current["files"] if p in committed]
+            folder_entries = [e for e in file_metadata if e.get("root_folder") == folder_path] if committed else []
 
+            for fpath in current["files"]:
                 if embedding_cancel_event.is_set():
+                    print("Cancel detected during file embedding loop.")
                     break
+                if fpath in committed:
+                    continue
 
-                text = "\n".join(text_parts)
-                if not text.strip():
-                    print(f"Skipped empty folder: {folder}")
-                else:
-                    emb = await embed_text_async(text)
-                    if emb is None or embedding_cancel_event.is_set():
-                        print("Embedding of folder cancelled/failed.")
-                        break
-                    folder_index.add(np.array([emb], dtype="float32"))
-                    entry = {
-                        "folder": folder,
-                        "path": folder_path,
-                        "embedding": emb.tolist(),
-                        "hash": folder_hash
-                    }
-                    folder_metadata.append(entry)
-                    faiss.write_index(folder_index, FOLDER_INDEX_FILE)
-                    save_jsonl(folder_metadata, FOLDER_METADATA_FILE)
-                    print(f"Embedded folder: {folder}")
+                f = os.path.basename(fpath)
+                fhash = current["hashes"][fpath]
+                try:
+                    fsize = os.path.getsize(fpath)
+                except OSError:
+                    fsize = 0
+                record = {"path": fpath, "hash": fhash, "size": fsize}
+                entry = {
+                    "file": f,
+                    "path": fpath,
+                    "root_folder": folder_path,
+                    "hash": fhash,
+                    "size": fsize
+                }
+
+                # Same content anywhere (other path, folder or root): reuse its vector
+                vec = store.get(fhash)
+                if vec is not None:
+                    if fpath in current["submitted"]:
+                        embedder.discard(fpath)
+                    add_unit(file_index, vec)
+                    file_metadata.append(entry)
+                    folder_entries.append(entry)
+                    await finish_file(record)
+                    continue
 
-            for dirpath, _, files in os.walk(folder_path):
-                for f in files:
+                result = await embedder.get(fpath)
+                if result is None:
                     if embedding_cancel_event.is_set():
-                        print("Cancel detected during file embedding loop.")
+                        print("Stop detected after embedding attempt.")
                         break
+                    await finish_file(record)
+                    continue
 
-                    fpath = os.path.join(dirpath, f)
-                    fhash = hash_file(fpath)
+                emb, n_chunks = result
+                store.put(fhash, emb, chunks=n_chunks)
+                add_unit(file_index, emb)
+                file_metadata.append(entry)
+                folder_entries.append(entry)
+                await finish_file(record)
+                print(f"Embedded file: {f}")
 
-                    if fpath in file_cache and file_cache[fpath]["hash"] == fhash:
-                        vec = np.array(file_cache[fpath]["embedding"], dtype="float32")
-                        file_index.add(np.array([vec]))
-                        file_metadata.append(file_cache[fpath])
-                        continue
+                if time.monotonic() - last_commit >= FLUSH_SECONDS:
+                    commit(folder)
+                    print(f"Flushed file cache at {len(file_metadata)} files")
 
-                    try:
-                        text = await extract_text_async(fpath)
-                    except asyncio.CancelledError:
-                        print("extract_text_async cancelled while embedding file.")
-                        raise
-                    except Exception as e:
-                        print(f"extract_text failed for {fpath}: {e}")
-                        text = ""
-
-                    if embedding_cancel_event.is_set():
-                        print("Cancel right after file extraction.")
-                        break
+            if embedding_cancel_event.is_set():
+                break
 
-                    if not text.strip():
-                        continue
-
-                    try:
-                        emb = await embed_text_async(text)
-                    except asyncio.CancelledError:
-                        print("embed_text_async cancelled")
-                        raise
-                    except Exception as e:
-                        print(f"File embedding failed: {f} — {e}")
-                        emb = None
-
-                    if emb is None:
-                        if embedding_cancel_event.is_set():
-                            print("Stop detected after embedding attempt.")
-                            break
-                        else:
-                            continue
-
-                    file_index.add(np.array([emb], dtype="float32"))
-                    entry = {
-                        "file": f,
-                        "path": fpath,
-                        "root_folder": folder_path,
+            cached = folder_cache.get(folder_path)
+            if cached and cached["hash"] == current["hash"]:
+                add_unit(folder_index, cached["embedding"])
+                folder_metadata.append(cached)
+                print(f"Folder cached: {folder}")
+            else:
+                # Chunk-weighted mean of the file vectors, i.e. the mean over every
+                # chunk in the folder, without holding the folder's text in memory
+                emb = folder_vector(folder_entries, store)
+                if emb is None:
+                    print(f"Skipped empty folder: {folder}")
+                else:
+                    add_unit(folder_index, emb)
+                    folder_metadata.append({
+                        "folder": folder,
+                        "path": folder_path,
+                        "root": root_dir,
                         "embedding": emb.tolist(),
-                        "hash": fhash
-                    }
-                    file_metadata.append(entry)
-                    print(f"Embedded file: {f}")
-                    file_count += 1
-
-                    if file_count % FLUSH_INTERVAL == 0:
-                        save_jsonl(file_metadata, FILE_METADATA_FILE)
-                        faiss.write_index(file_index, FILE_INDEX_FILE)
-                        print(f"Flushed file cache at {len(file_metadata)} files")
-                        file_count = 0
+                        "hash": current["hash"]
+                    })
+                    print(f"Embedded folder: {folder}")
 
-                    gc.collect()
-                if embedding_cancel_event.is_set():
-                    break
-
-            done_folders += 1
-            if progress_callback:
-                try:
-                    asyncio.create_task(progress_callback(done_folders, total_folders))
-                except Exception:
-                    await progress_callback(done_folders, total_folders)
+            folder_done = True
+            commit(folder, folder_done=True)
 
     except asyncio.CancelledError:
-        print("embed_folders_and_files task received CancelledError — exiting early.")
+        print(f"Embedding of {root_dir} received CancelledError — exiting early.")
         raise
     finally:
+        if owns_embedder:
+            await embedder.close()
         try:
-            if folder_metadata:
-                save_jsonl(folder_metadata, FOLDER_METADATA_FILE)
-                faiss.write_index(folder_index, FOLDER_INDEX_FILE)
-            if file_metadata:
-                save_jsonl(file_metadata, FILE_METADATA_FILE)
-                faiss.write_index(file_index, FILE_INDEX_FILE)
-            print("Partial progress saved in finally block.")
+            # Whatever finished so far is committed, so a resume starts right here.
+            # A stop before anything finished must not replace the shard with an
+            # empty one; a finished run over an empty root still writes its shard.
+            finished = not remaining and not prepared and not embedding_cancel_event.is_set()
+            if dirty or (finished and not commits):
+                commit(folder, folder_done=folder_done)
+            if commits:
+                write_manifest(
+                    root_dir, len(file_metadata), len(folder_metadata),
+                    complete=not embedding_cancel_event.is_set()
+                )
+                print(f"Partial progress saved for {root_dir}.")
         except Exception as e:
             print(f"Failed to save progress on exit: {e}")
 
+
+async def embed_folders_and_files(root_dirs=None, progress_callback=None, broadcast_callback=None,
+                                  resume=False, memory_budget_mb=None, workers=None):
+    """
+    Embeds every configured root (or just root_dirs) into its own shard.
+    Shards are built concurrently and share one progress tracker.
+    With resume=True the last checkpointed run is continued instead.
+    memory_budget_mb bounds RSS by adapting batch size and read-ahead.
+    workers > 1 runs inference in that many processes, one model each.
+    """
+    init_catalog()
+    workers = workers or EMBED_WORKERS
+    tracker = ProgressTracker()
+    budget = MemoryBudget(memory_budget_mb or RSS_BUDGET_MB, include_children=workers > 1)
+    embedder = None
+    run_started = time.monotonic()
+    checkpoint = load_checkpoint() if resume else None
+    if resume and checkpoint is None:
+        raise ValueError("No interrupted embedding run to resume.")
+
+    # The live index maintainer holds its changes until the run ends
+    embedding_running.set()
+    try:
+        if checkpoint:
+            folders_by_root = checkpoint.roots()
+            checkpoint.restore_progress(tracker)
+        else:
+            if root_dirs is None:
+                root_dirs = load_roots()
+            elif isinstance(root_dirs, str):
+                root_dirs = [root_dirs]
+            root_dirs = [normalize_root(r) for r in root_dirs]
+
+            folders_by_root = {root: list_folders(root) for root in root_dirs}
+            total_files, total_bytes = await asyncio.to_thread(
+                scan_tree,
+                [os.path.join(root, f) for root, folders in folders_by_root.items() for f in folders]
+            )
+            tracker = ProgressTracker(total_files, total_bytes)
+            checkpoint = RunCheckpoint()
+            for root, folders in folders_by_root.items():
+                checkpoint.start_root(root, folders)
+            checkpoint.save(tracker)
+        await report_progress(progress_callback, tracker)
+
+        if workers > 1:
+            embedder = ProcessEmbedder(workers, budget)
+            embedder.start()
+
+        tasks = [
+            asyncio.create_task(
+                embed_root(root, folders, tracker, progress_callback, checkpoint, budget, embedder)
+            )
+            for root, folders in folders_by_root.items()
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # gather leaves the other roots running when one fails; stop them and
+            # let their own commits finish before the embedder is torn down
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if not embedding_cancel_event.is_set():
+            clear_checkpoint()
+    finally:
+        embedding_running.clear()
+        if embedder:
+            await embedder.close()
+
+        summary = {
+            "action": "embed_summary",
+            "files": tracker.done_files,
+            "bytes": tracker.done_bytes,
+            "elapsed_seconds": round(time.monotonic() - run_started, 1),
+            "workers": workers,
+            **budget.summary()
+        }
+        print(f"Embedding run summary: {summary}")
+
         if broadcast_callback:
             try:
+                await broadcast_callback(summary)
                 await broadcast_callback({"action": "embed_stopped"})
             except Exception as e:
                 print(f"broadcast_callback failed during final stopped: {e}")
 
-        if progress_callback:
-            try:
-                await progress_callback(
-                    total_folders if not embedding_cancel_event.is_set() else done_folders,
-                    total_folders
-                )
-            except Exception:
-                pass
+        await report_progress(progress_callback, tracker, final=not embedding_cancel_event.is_set())
 
 
 if __name__ == "__main__":
-    root_dir = os.path.expanduser("~/Desktop")
-    print(f"Starting embedding in: {root_dir}")
-    asyncio.run(embed_folders_and_files(root_dir))
+    roots = load_roots()
+    print(f"Starting embedding in: {', '.join(roots)}")
+    asyncio.run(embed_folders_and_files(roots))
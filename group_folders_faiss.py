@@ -1,12 +1,22 @@
 import os
 import json
+import uuid
+import asyncio
+import sqlite3
 import faiss
 import numpy as np
 from sklearn.cluster import KMeans
+from index_roots import load_roots, shard_paths
+from shared_llm import llm_lock
+from catalog import (
+    init_catalog, current_paths, plan_moves, complete_move, fail_move,
+    interrupted_moves, reverse_plan, plan_undo, record_undo, cancel_undo
+)
 
+MOVE_CONCURRENCY = 8
+
+# Written by earlier versions, only read for undo when the catalog has no moves
 UNDO_LOG_PATH = os.path.expanduser("~/Desktop/grouping_undo_log.json")
-FAISS_INDEX_PATH = "./folder_index.faiss"
-METADATA_PATH = "./folder_metadata.jsonl"
 
 
 def build_prompt_from_folders(folder_names):
@@ -26,7 +36,8 @@ Group Name:"""
 def get_llm_group_name(llm, folder_names):
     prompt = build_prompt_from_folders(folder_names)
     try:
-        response = llm(prompt, max_tokens=20, stop=["\n"])
+        with llm_lock:
+            response = llm(prompt, max_tokens=20, stop=["\n"])
         name = response["choices"][0]["text"].strip()
         return name.replace(" ", "_").replace("-", "_") if name else None
     except Exception as e:
@@ -34,28 +45,189 @@ def get_llm_group_name(llm, folder_names):
         return None
 
 
-async def group_folders_from_faiss(k=4, llm=None, progress_callback=None):
-    # Load FAISS index
-    index = faiss.read_index(FAISS_INDEX_PATH)
-
-    # Load metadata
+def load_folder_vectors(roots=None):
+    """
+    Collects folder paths, their root and vectors from every root's shard.
+    """
     folder_paths = []
-    with open(METADATA_PATH, "r") as f:
-        for line in f:
-            obj = json.loads(line)
-            folder_paths.append(obj["path"])
+    folder_roots = []
+    vectors = []
+    for root in roots or load_roots():
+        paths = shard_paths(root)
+        if not (os.path.exists(paths["folder_index"]) and os.path.exists(paths["folder_metadata"])):
+            continue
+        index = faiss.read_index(paths["folder_index"])
+        with open(paths["folder_metadata"], "r") as f:
+            entries = [json.loads(line) for line in f]
+        # Folders may have moved since they were indexed
+        current = current_paths(root, range(len(entries)), table="folders")
+        for i, obj in enumerate(entries):
+            folder_paths.append(current.get(i, obj["path"]))
+            folder_roots.append(obj.get("root", root))
+        if index.ntotal:
+            vectors.append(np.array(index.reconstruct_n(0, index.ntotal)))
+    if not vectors:
+        raise ValueError("No folder embeddings found. Run embedding first.")
+    return folder_paths, folder_roots, np.vstack(vectors)
+
+
+def path_and_parents(path):
+    while True:
+        yield path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return
+        path = parent
+
+
+def find_conflicts(moves):
+    """
+    Dry run over a whole move plan before anything is renamed.
+    Returns (runnable moves, conflicts), every conflict with a reason.
+    Runnable moves touch disjoint paths, so they can be renamed in any
+    order or all at once; a move nested in an earlier one is a conflict.
+    """
+    runnable = []
+    conflicts = []
+    claimed = set()  # sources and destinations of runnable moves
+    claimed_parents = set()  # every directory above them
+    for move in moves:
+        src = move["from"].rstrip(os.sep)
+        dst = move["to"].rstrip(os.sep)
+        parent = os.path.dirname(dst)
+        if not os.path.isdir(src):
+            reason = "Source missing"
+        elif os.path.lexists(dst):
+            reason = "Destination exists"
+        elif dst in claimed:
+            reason = "Another folder moves to the same destination"
+        elif dst.startswith(src + os.sep):
+            reason = "Destination is inside the source"
+        elif os.path.lexists(parent) and not os.path.isdir(parent):
+            reason = "Destination parent is a file"
+        elif any(p in claimed for path in (src, dst) for p in path_and_parents(path)) or \
+                src in claimed_parents or dst in claimed_parents:
+            # e.g. grouping into Photos/ while the existing Photos folder moves away
+            reason = "Depends on another folder being moved"
+        else:
+            claimed.update((src, dst))
+            for path in (src, dst):
+                claimed_parents.update(list(path_and_parents(path))[1:])
+            runnable.append(move)
+            continue
+        print(f"{reason}, skipping: {move['from']} → {move['to']}")
+        conflicts.append({"from": move["from"], "to": move["to"], "reason": reason})
+    return runnable, conflicts
 
-    # Get embeddings
-    embeddings = index.reconstruct_n(0, index.ntotal)
-    embeddings = np.array(embeddings)
 
-    total = len(folder_paths)
-    if progress_callback:
-        await progress_callback(0, total)
+def finish_move(move, error=None):
+    """
+    Journals the outcome of one rename; legacy undo log moves have no id.
+    Returns an error message if the journal could not be updated.
+    """
+    if move["id"] is None:
+        return None
+    try:
+        if move.get("undo"):
+            if error:
+                cancel_undo(move["id"])
+            else:
+                record_undo(move["id"], move["from"], move["to"])
+        elif error:
+            fail_move(move["id"])
+        else:
+            complete_move(move["id"], move["from"], move["to"])
+    except sqlite3.Error as e:
+        # The move stays planned/undoing, so the next resume journals it again
+        print(f"Failed to journal move of {move['from']}: {e}")
+        return f"{move['from']}: journal update failed: {e}"
+    return None
+
+
+async def run_moves(moves, progress_callback=None, phase=None):
+    """
+    Renames independent folders concurrently, at most MOVE_CONCURRENCY at
+    a time. Each outcome is journaled on the event loop as it finishes.
+    Returns the error messages.
+    """
+    semaphore = asyncio.Semaphore(MOVE_CONCURRENCY)
+    errors = []
+    total = len(moves)
 
-    for i in range(total):
+    async def rename(move):
+        async with semaphore:
+            try:
+                await asyncio.to_thread(os.makedirs, os.path.dirname(move["to"]), exist_ok=True)
+                await asyncio.to_thread(os.rename, move["from"], move["to"])
+                return move, None
+            except OSError as e:
+                return move, e
+
+    if progress_callback and total:
+        await progress_callback(0, total, phase=phase)
+    for done, next_move in enumerate(asyncio.as_completed([rename(m) for m in moves]), start=1):
+        move, error = await next_move
+        if error:
+            print(f"Failed to move {move['from']}: {error}")
+            errors.append(f"{move['from']}: {error}")
+        journal_error = finish_move(move, error)
+        if journal_error:
+            errors.append(journal_error)
         if progress_callback:
-            await progress_callback(i + 1, total)
+            await progress_callback(done, total, phase=phase)
+    return errors
+
+
+async def resume_interrupted(progress_callback=None, rollback=False):
+    """
+    Finishes a grouping or undo that was interrupted, from the journal.
+    Renames that already happened are only journaled, the rest are redone.
+    With rollback an interrupted grouping is reversed instead: moves that
+    never started are marked failed and finished ones are undone.
+    Returns (number of moves resumed, error messages).
+    """
+    init_catalog()
+    journaled = interrupted_moves()
+    if not journaled:
+        return 0, []
+    print(f"Resuming {len(journaled)} interrupted folder moves")
+
+    pending = []
+    errors = []
+    for entry in journaled:
+        undo = entry["state"] == "undoing"
+        src, dst = (entry["dst"], entry["src"]) if undo else (entry["src"], entry["dst"])
+        move = {"id": entry["id"], "from": src, "to": dst, "undo": undo}
+        if os.path.exists(dst) and not os.path.exists(src):
+            journal_error = finish_move(move)
+            if rollback and not undo and not journal_error:
+                pending.append({"id": entry["id"], "from": dst, "to": src, "undo": True})
+        elif os.path.exists(src) and not os.path.exists(dst):
+            if not rollback or undo:
+                pending.append(move)
+                continue
+            # Never started, so there is nothing to reverse
+            journal_error = finish_move(move, error=True)
+        else:
+            errors.append(f"Cannot resume move of {src}: source and destination conflict")
+            journal_error = finish_move(move, error=True)
+        if journal_error:
+            errors.append(journal_error)
+
+    plan_undo(m["id"] for m in pending if m["undo"])
+    errors += await run_moves(pending, progress_callback, phase="undo" if rollback else "resume")
+    return len(journaled), errors
+
+
+async def group_folders_from_faiss(k=4, llm=None, progress_callback=None):
+    # Finish an interrupted grouping or undo first, rather than grouping on top of it
+    resumed, errors = await resume_interrupted(progress_callback)
+    if resumed:
+        yield {"final": True, "groups": {}, "resumed": resumed, "conflicts": [], "errors": errors}
+        return
+
+    folder_paths, folder_roots, embeddings = load_folder_vectors()
+    k = min(k, len(folder_paths))
 
     # Cluster embeddings
     kmeans = KMeans(n_clusters=k, random_state=42, n_init="auto")
@@ -63,83 +235,64 @@ async def group_folders_from_faiss(k=4, llm=None, progress_callback=None):
 
     # Group folder paths
     groups = [[] for _ in range(k)]
-    for path, label in zip(folder_paths, labels):
-        groups[label].append(path)
+    for path, root, label in zip(folder_paths, folder_roots, labels):
+        groups[label].append((path, root))
 
-    desktop = os.path.expanduser("~/Desktop")
-    undo_log = []
     group_name_map = {}
+    plan = []
 
     for i, group in enumerate(groups):
-        folder_names = [os.path.basename(p) for p in group]
+        folder_names = [os.path.basename(p) for p, _ in group]
         group_name = get_llm_group_name(llm, folder_names) if llm else f"Group_{i}"
         print(f"Group {i + 1}: {folder_names} → Suggested name: {group_name}")
         group_name = group_name or f"Group_{i}"
 
-        group_dir = os.path.join(desktop, group_name)
-        os.makedirs(group_dir, exist_ok=True)
         group_name_map[group_name] = folder_names
 
-        for folder_path in group:
-            if not os.path.exists(folder_path):
-                print(f"Folder does not exist: {folder_path}")
-                continue
-
-            folder_name = os.path.basename(folder_path)
-            new_path = os.path.join(group_dir, folder_name)
-
-            try:
-                os.rename(folder_path, new_path)
-                undo_log.append({"from": new_path, "to": folder_path})
-            except Exception as e:
-                print(f"Failed to move {folder_path}: {e}")
+        # Folders are grouped inside their own root so moves never cross drives
+        for folder_path, root in group:
+            new_path = os.path.join(root, group_name, os.path.basename(folder_path))
+            plan.append({"id": None, "from": folder_path, "to": new_path})
 
-    # Save undo log
-    with open(UNDO_LOG_PATH, "w") as f:
-        json.dump(undo_log, f, indent=2)
+    moves, conflicts = find_conflicts(plan)
+    # Journaled before the first rename, so a crash part-way can be finished or undone
+    moves = plan_moves(uuid.uuid4().hex, moves)
+    errors = await run_moves(moves, progress_callback, phase="grouping")
 
     # Indicate completion
-    yield {"final": True, "groups": group_name_map}
+    yield {"final": True, "groups": group_name_map, "conflicts": conflicts, "errors": errors}
 
 
-async def undo_grouping(progress_callback=None):
+def load_legacy_undo_log():
     if not os.path.exists(UNDO_LOG_PATH):
-        print("Undo log not found.")
-        return {"status": "error", "message": "Undo log not found."}
-
+        return []
     with open(UNDO_LOG_PATH, "r") as f:
-        undo_moves = json.load(f)
-
-    errors = []
-    total = len(undo_moves)
+        return [{"id": None, "from": m["from"], "to": m["to"]} for m in json.load(f)]
 
-    for i, move in enumerate(undo_moves):
-        src = move["from"]
-        dst = move["to"]
 
-        print(f"Moving back: {src} → {dst}")
-        if not os.path.exists(src):
-            print(f"Source not found: {src}")
-            errors.append(f"Source missing: {src}")
-            continue
-
-        if os.path.exists(dst):
-            print(f"Destination exists, skipping: {dst}")
-            errors.append(f"Destination exists: {dst}")
-            continue
-
-        try:
-            os.rename(src, dst)
-        except Exception as e:
-            print(f"Rename failed: {e}")
-            errors.append(str(e))
-
-        if progress_callback:
-            await progress_callback(i + 1, total)
+async def undo_grouping(progress_callback=None):
+    # An interrupted grouping is rolled back and an interrupted undo finished, then stop there
+    resumed, errors = await resume_interrupted(progress_callback, rollback=True)
+    if resumed:
+        undo_moves = []
+    else:
+        batch, undo_moves = reverse_plan()
+        if not undo_moves:
+            batch, undo_moves = None, load_legacy_undo_log()
+        if not undo_moves:
+            print("Nothing to undo.")
+            return {"status": "error", "message": "Nothing to undo."}
+
+        moves, conflicts = find_conflicts([{**m, "undo": True} for m in undo_moves])
+        errors += [f"{c['reason']}: {c['from']}" for c in conflicts]
+        plan_undo(m["id"] for m in moves if m["id"] is not None)
+        errors += await run_moves(moves, progress_callback, phase="undo")
 
     if not errors:
-        os.remove(UNDO_LOG_PATH)
-        return {"status": "success", "message": "Undo completed successfully."}
+        if not resumed and batch is None and os.path.exists(UNDO_LOG_PATH):
+            os.remove(UNDO_LOG_PATH)
+        message = "Interrupted operation undone." if resumed else "Undo completed successfully."
+        return {"status": "success", "message": message}
     else:
         return {
             "status": "partial",
@@ -55,10 +55,20 @@ socket.onmessage = (event) => {
 
       progressBar.value = data.done;
       progressBar.max = data.total;
-      label.textContent = `Embedding folders (${data.done}/${data.total})`;
+      const verb =
+        data.phase === "grouping" ? "Moving folders" :
+        data.phase === "undo" ? "Restoring folders" :
+        data.phase === "resume" ? "Finishing interrupted moves" :
+        "Embedding files";
+      label.textContent = `${verb} (${data.done}/${data.total})`;
+      if (data.bytes_per_sec !== undefined) {
+        const rate = (data.bytes_per_sec / (1024 * 1024)).toFixed(1);
+        const eta = data.eta_seconds === null ? "--" : formatDuration(data.eta_seconds);
+        label.textContent += ` · ${rate} MB/s · ETA ${eta}`;
+      }
 
       if (data.done === data.total) {
-        label.textContent = "Embedding complete!";
+        label.textContent = data.phase ? "Done!" : "Embedding complete!";
         if (groupBtn) groupBtn.disabled = false;
         if (undoBtn) undoBtn.disabled = false;
         if (stopBtn) stopBtn.style.display = "none";
@@ -79,6 +89,23 @@ socket.onmessage = (event) => {
     return;
   }
 
+  if (data.action === "embed_summary") {
+    console.log(`Embedding run: ${data.files} files in ${data.elapsed_seconds}s, peak memory ${data.peak_rss_mb} MB`);
+    return;
+  }
+
+  if (data.action === "embed_nothing_to_resume") {
+    if (stopBtn) stopBtn.style.display = "none";
+    if (groupBtn) groupBtn.disabled = false;
+    if (undoBtn) undoBtn.disabled = false;
+    const progressBar = document.getElementById("embedding-progress");
+    const label = document.getElementById("progress-label");
+    if (progressBar) progressBar.style.display = "none";
+    if (label) label.style.display = "none";
+    alert("There is no interrupted embedding run to resume.");
+    return;
+  }
+
   if (data.action === "embed_stopping") {
     if (stopBtn) stopBtn.style.display = "none";
     if (groupBtn) groupBtn.disabled = false;
@@ -119,8 +146,14 @@ socket.onmessage = (event) => {
   if (data.action === "group_result") {
     document.getElementById("embedding-progress").style.display = "none";
     document.getElementById("progress-label").style.display = "none";
-    if (data.status === "success") {
+    if (data.resumed) {
+      alert(`Finished ${data.resumed} folder moves from an interrupted operation.`);
+    } else if (data.status === "success") {
       alert("Folders grouped into:\n\n" + JSON.stringify(data.groups, null, 2));
+    } else if (data.status === "partial") {
+      const skipped = data.conflicts.map(c => `${c.reason}: ${c.from}`).concat(data.errors);
+      alert("Folders grouped into:\n\n" + JSON.stringify(data.groups, null, 2) +
+        "\n\nNot moved:\n" + skipped.join("\n"));
     } else {
       alert("Grouping failed: " + data.message);
     }
@@ -132,7 +165,9 @@ socket.onmessage = (event) => {
     undoInProgress = false;
 
     if (data.status === "success") {
-      alert("Undo completed.");
+      alert(data.message || "Undo completed.");
+    } else if (data.status === "partial") {
+      alert(data.message + "\n\n" + (data.errors || []).join("\n"));
     } else if (data.status === "error") {
       alert("Undo failed: " + (data.message || "Unknown error"));
     }
@@ -145,6 +180,12 @@ socket.onmessage = (event) => {
     return;
   }
 
+  // Duplicate files report
+  if (data.action === "duplicates_result") {
+    renderDuplicates(data);
+    return;
+  }
+
   if (data.action === "status" && undoInProgress) {
     return;
   }
@@ -182,6 +223,27 @@ socket.onmessage = (event) => {
   const category = document.createElement("p");
   category.textContent = `Suggested category: ${data.category}`;
 
+  // Ranked alternatives with confidence, the selected one is used for Move
+  const candidates = data.candidates || [];
+  let categorySelect = null;
+  if (candidates.length > 0) {
+    categorySelect = document.createElement("select");
+    candidates.forEach(c => {
+      const option = document.createElement("option");
+      option.value = c.category;
+      option.textContent = `${c.category} (${Math.round(c.confidence * 100)}%)`;
+      if (c.category === data.category) option.selected = true;
+      categorySelect.appendChild(option);
+    });
+    if (data.category === "Uncategorized") {
+      const option = document.createElement("option");
+      option.value = "Uncategorized";
+      option.textContent = "Uncategorized (low confidence)";
+      option.selected = true;
+      categorySelect.insertBefore(option, categorySelect.firstChild);
+    }
+  }
+
   const summary = document.createElement("p");
   summary.textContent = `Summary: ${data.summary || "No summary available."}`;
   summary.classList.add("summary");
@@ -189,7 +251,8 @@ socket.onmessage = (event) => {
   const moveBtn = document.createElement("button");
   moveBtn.textContent = "Move";
   moveBtn.onclick = () => {
-    socket.send(JSON.stringify({ action: "move", path: data.path, category: data.category }));
+    const chosen = categorySelect ? categorySelect.value : data.category;
+    socket.send(JSON.stringify({ action: "move", path: data.path, category: chosen }));
     moveBtn.disabled = true;
     skipBtn.disabled = true;
   };
@@ -204,12 +267,67 @@ socket.onmessage = (event) => {
 
   fileCard.appendChild(title);
   fileCard.appendChild(category);
+  if (categorySelect) fileCard.appendChild(categorySelect);
   fileCard.appendChild(summary);
   fileCard.appendChild(moveBtn);
   fileCard.appendChild(skipBtn);
   fileContainer.appendChild(fileCard);
 };
 
+// Human readable byte size
+function formatBytes(bytes) {
+  const units = ["B", "KB", "MB", "GB", "TB"];
+  let i = 0;
+  while (bytes >= 1024 && i < units.length - 1) {
+    bytes /= 1024;
+    i++;
+  }
+  return `${bytes.toFixed(i === 0 ? 0 : 1)} ${units[i]}`;
+}
+
+function renderDuplicates(data) {
+  const summary = document.getElementById("duplicates-summary");
+  const tbody = document.querySelector("#duplicates-table tbody");
+  const findBtn = document.getElementById("find-duplicates");
+  if (findBtn) findBtn.disabled = false;
+  tbody.innerHTML = "";
+
+  if (data.status !== "success") {
+    summary.textContent = "Duplicate scan failed: " + (data.message || "Unknown error");
+    return;
+  }
+
+  summary.textContent = data.groups.length
+    ? `${data.groups.length} sets of duplicates, ${formatBytes(data.wasted_bytes)} reclaimable`
+    : "No duplicate files found.";
+
+  data.groups.forEach(group => {
+    const tr = document.createElement("tr");
+    const size = document.createElement("td");
+    size.textContent = formatBytes(group.size);
+    const copies = document.createElement("td");
+    copies.textContent = group.paths.length;
+    const paths = document.createElement("td");
+    group.paths.forEach(p => {
+      const line = document.createElement("div");
+      line.textContent = p;
+      paths.appendChild(line);
+    });
+    tr.appendChild(size);
+    tr.appendChild(copies);
+    tr.appendChild(paths);
+    tbody.appendChild(tr);
+  });
+}
+
+// Format seconds as m:ss or h:mm:ss
+function formatDuration(seconds) {
+  const h = Math.floor(seconds / 3600);
+  const m = Math.floor((seconds % 3600) / 60);
+  const s = String(Math.floor(seconds % 60)).padStart(2, "0");
+  return h > 0 ? `${h}:${String(m).padStart(2, "0")}:${s}` : `${m}:${s}`;
+}
+
 // Encode path to ID
 function getCardId(path) {
   return "card-" + btoa(path).replace(/[^a-z0-9]/gi, '');
@@ -238,6 +356,13 @@ document.getElementById("view-history").onclick = async () => {
   });
 };
 
+// Find Duplicates
+document.getElementById("find-duplicates").onclick = () => {
+  document.getElementById("find-duplicates").disabled = true;
+  document.getElementById("duplicates-summary").textContent = "Scanning...";
+  socket.send(JSON.stringify({ action: "duplicates" }));
+};
+
 // Group Similar Folders
 document.getElementById("group-folders").onclick = () => {
   const progressBar = document.getElementById("embedding-progress");
@@ -268,6 +393,25 @@ document.getElementById("start-embedding").onclick = () => {
   socket.send(JSON.stringify({ action: "start_embedding" }));
 };
 
+document.getElementById("resume-embedding").onclick = () => {
+  const progressBar = document.getElementById("embedding-progress");
+  const label = document.getElementById("progress-label");
+  groupBtn = document.getElementById("group-folders");
+  undoBtn = document.getElementById("undo-grouping");
+  stopBtn = document.getElementById("stop-embedding");
+
+  // The first progress message restores the previous run's position
+  progressBar.style.display = "block";
+  label.style.display = "block";
+  if (stopBtn) stopBtn.style.display = "inline-block";
+  label.textContent = "Resuming embedding...";
+
+  if (groupBtn) groupBtn.disabled = true;
+  if (undoBtn) undoBtn.disabled = true;
+
+  socket.send(JSON.stringify({ action: "resume_embedding" }));
+};
+
 document.getElementById("stop-embedding").onclick = () => {
   console.log("Sending stop_embedding message");
   socket.send(JSON.stringify({ action: "stop_embedding" }));
@@ -0,0 +1,485 @@
+import os
+import time
+import asyncio
+import threading
+import numpy as np
+import faiss
+from watchdog.events import FileSystemEventHandler
+import folder_embed_and_classify as fe
+from extractor import extract_text
+from embedding_state import embedding_running
+from index_roots import load_roots, shard_paths, read_manifest, write_manifest, SHARDS_DIR
+from content_store import get_store, hash_files, CONTENT_STORE_DIR
+from catalog import sync_shard, current_paths, CATALOG_DB
+from embed_checkpoint import CHECKPOINT_FILE
+from memory_budget import DEFAULT_BATCH_SIZE
+from logger import DB_FILE
+
+# --- Config ---
+QUIET_PERIOD = 1.0  # apply once no event has arrived for this long...
+MAX_DELAY = 5.0  # ...but never hold the oldest pending event longer than this
+BATCH_SIZE = 200
+IGNORED_SUFFIXES = (".crdownload", ".part", ".tmp", ".swp")
+# The organiser's own files, so writing the index never triggers another update
+IGNORED_PATHS = [os.path.abspath(p) for p in (SHARDS_DIR, CONTENT_STORE_DIR, CATALOG_DB, DB_FILE, CHECKPOINT_FILE)]
+
+
+def is_ignored(path):
+    path = os.path.abspath(path)
+    return path.endswith(IGNORED_SUFFIXES) or any(path.startswith(p) for p in IGNORED_PATHS)
+
+
+def top_folder(root, path):
+    # embed_root only indexes files inside the root's top-level folders
+    parts = os.path.relpath(path, root).split(os.sep)
+    if len(parts) < 2 or parts[0] == "..":
+        return None
+    return os.path.join(root, parts[0])
+
+
+class ShardState:
+    """
+    In-memory copy of one root's shard that live changes are applied to.
+    Removals are collected and compacted on commit, so row ids stay stable
+    while a batch is being applied. A batch that only adds files is appended
+    to the shard and the catalog instead of rewriting them.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.paths = shard_paths(root)
+        self.file_index = faiss.read_index(self.paths["file_index"])
+        self.file_metadata = fe.load_jsonl(self.paths["file_metadata"])
+        self.folder_metadata = fe.load_jsonl(self.paths["folder_metadata"])
+        self.hashed = {e["path"]: e for e in fe.load_jsonl(self.paths["file_hashes"])}
+        self.rows = {e["path"]: i for i, e in enumerate(self.file_metadata)}
+        self.stamp = self.disk_stamp(root)
+        self.reset()
+        self.adopt_current_paths()
+
+    @staticmethod
+    def disk_stamp(root):
+        paths = shard_paths(root)
+        if not (os.path.exists(paths["file_index"]) and os.path.exists(paths["file_metadata"])):
+            return None
+        return os.path.getmtime(paths["file_index"]), os.path.getmtime(paths["file_metadata"])
+
+    def reset(self):
+        self.removed = set()
+        self.added = []
+        self.dirty = set()
+        self.new_hashes = []
+        # Set once a record already on disk changed, the files then need a full rewrite
+        self.rewrite = False
+        self.counts = {"added": 0, "updated": 0, "removed": 0, "renamed": 0}
+
+    @property
+    def changed(self):
+        return bool(self.removed or self.added or self.dirty or self.new_hashes or self.rewrite)
+
+    def adopt_current_paths(self):
+        # Folders grouped while nothing was watching are only known to the catalog
+        current = current_paths(self.root, range(len(self.file_metadata)))
+        for i, entry in enumerate(self.file_metadata):
+            path = current.get(i)
+            if path and path != entry["path"]:
+                self.rename(entry["path"], path, is_dir=False)
+
+    def paths_under(self, path):
+        prefix = path.rstrip(os.sep) + os.sep
+        return [p for p in set(self.rows) | set(self.hashed) if p.startswith(prefix)]
+
+    def _drop_row(self, path):
+        i = self.rows.pop(path, None)
+        if i is None:
+            return False
+        self.removed.add(i)
+        self.dirty.add(self.file_metadata[i]["root_folder"])
+        return True
+
+    def knows(self, path):
+        return path in self.rows or path in self.hashed
+
+    def remove(self, path, is_dir):
+        for p in self.paths_under(path) if is_dir else [path]:
+            if self.hashed.pop(p, None):
+                self.rewrite = True
+            if self._drop_row(p):
+                self.counts["removed"] += 1
+
+    def rename(self, src, dst, is_dir):
+        if is_dir:
+            pairs = [(p, dst + p[len(src):]) for p in self.paths_under(src)]
+        else:
+            pairs = [(src, dst)]
+        for old, new in pairs:
+            record = self.hashed.pop(old, None)
+            new_folder = top_folder(self.root, new)
+            if new_folder is None:
+                # Moved up to the root itself, which is never indexed
+                if self._drop_row(old):
+                    self.counts["removed"] += 1
+                continue
+            if record:
+                record["path"] = new
+                self.hashed[new] = record
+                self.rewrite = True
+            i = self.rows.pop(old, None)
+            if i is None:
+                continue
+            entry = self.file_metadata[i]
+            self.dirty.update((entry["root_folder"], new_folder))
+            entry.update(file=os.path.basename(new), path=new, root_folder=new_folder)
+            self.rows[new] = i
+            self.counts["renamed"] += 1
+
+    def upsert(self, path, content_hash, size, vector):
+        folder = top_folder(self.root, path)
+        self.counts["updated" if self._drop_row(path) else "added"] += 1
+        record = {"path": path, "hash": content_hash, "size": size}
+        if path in self.hashed:
+            self.rewrite = True
+        else:
+            self.new_hashes.append(record)
+        self.hashed[path] = record
+        if vector is None:
+            return
+        self.added.append(({
+            "file": os.path.basename(path),
+            "path": path,
+            "root_folder": folder,
+            "hash": content_hash,
+            "size": size
+        }, vector))
+        self.dirty.add(folder)
+
+    def update_folders(self, store):
+        by_folder = {}
+        for entry in self.file_metadata:
+            by_folder.setdefault(entry["root_folder"], []).append(entry)
+
+        # Same result as a full run: one vector per top-level folder that has files
+        folders = [f for f in self.folder_metadata if f["path"] not in self.dirty and f["path"] in by_folder]
+        for folder_path in sorted(p for p in self.dirty if p in by_folder):
+            emb = fe.folder_vector(by_folder[folder_path], store)
+            if emb is None:
+                continue
+            prefix = folder_path + os.sep
+            file_hashes = {p: e["hash"] for p, e in self.hashed.items() if p.startswith(prefix)}
+            folders.append({
+                "folder": os.path.basename(folder_path),
+                "path": folder_path,
+                "root": self.root,
+                "embedding": emb.tolist(),
+                "hash": fe.hash_folder(folder_path, file_hashes)
+            })
+        self.folder_metadata = folders
+
+        folder_index = faiss.IndexFlatL2(fe.EMBEDDING_DIM)
+        if folders:
+            fe.add_unit(folder_index, [f["embedding"] for f in folders])
+        return folder_index
+
+    def commit(self, store):
+        # Without removals or in-place changes the old rows keep their ids, new ones go on the end
+        start = None if self.removed or self.rewrite else len(self.file_metadata)
+        if self.removed:
+            self.file_index.remove_ids(np.array(sorted(self.removed), dtype="int64"))
+        metadata = [e for i, e in enumerate(self.file_metadata) if i not in self.removed]
+        if self.added:
+            fe.add_unit(self.file_index, [vec for _, vec in self.added])
+            metadata += [entry for entry, _ in self.added]
+        self.file_metadata = metadata
+        self.rows = {e["path"]: i for i, e in enumerate(metadata)}
+        folder_index = self.update_folders(store)
+
+        # Vectors first, like embed_root's commit, so metadata never points at a missing row
+        store.flush()
+        fe.save_jsonl(self.folder_metadata, self.paths["folder_metadata"])
+        fe.save_index(folder_index, self.paths["folder_index"])
+        # A flat index has no append format, but the rows it gains are written before their metadata
+        fe.save_index(self.file_index, self.paths["file_index"])
+        if start is None:
+            fe.save_jsonl(self.file_metadata, self.paths["file_metadata"])
+            fe.save_jsonl(list(self.hashed.values()), self.paths["file_hashes"])
+            # Removals renumber the rows behind them, so the root is resynced as a whole
+            sync_shard(self.root, self.file_metadata, self.folder_metadata)
+        else:
+            fe.append_jsonl(self.file_metadata[start:], self.paths["file_metadata"])
+            fe.append_jsonl(self.new_hashes, self.paths["file_hashes"])
+            sync_shard(self.root, self.file_metadata, self.folder_metadata, start=start)
+        manifest = read_manifest(self.root) or {}
+        write_manifest(
+            self.root, len(self.file_metadata), len(self.folder_metadata),
+            complete=manifest.get("complete", True)
+        )
+        self.stamp = self.disk_stamp(self.root)
+
+        counts = self.counts
+        self.reset()
+        return counts
+
+
+class IndexEventHandler(FileSystemEventHandler):
+    def __init__(self, maintainer):
+        self.maintainer = maintainer
+
+    def on_created(self, event):
+        self.maintainer.queue("scan" if event.is_directory else "upsert", event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.maintainer.queue("upsert", event.src_path)
+
+    def on_deleted(self, event):
+        self.maintainer.queue("remove", event.src_path, is_dir=event.is_directory)
+
+    def on_moved(self, event):
+        self.maintainer.queue("move", event.src_path, event.dest_path, event.is_directory)
+
+
+class IndexMaintainer:
+    """
+    Keeps every root's shard in step with the disk from watchdog events.
+    Events are debounced and applied in batches of at most BATCH_SIZE,
+    as add/update/rename/remove on the file index, metadata and catalog.
+    Roots without a shard are left to the first full embedding run.
+    """
+
+    def __init__(self, observer, loop=None, broadcast_callback=None):
+        self.observer = observer
+        self.loop = loop
+        self.broadcast_callback = broadcast_callback
+        self.handler = IndexEventHandler(self)
+        self.watches = {}
+        self.roots = []
+        self.shards = {}
+        self.lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.pending = []
+        self.pending_upserts = set()
+        self.first_event = None
+        self.last_event = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="index-maintainer", daemon=True)
+
+    def start(self):
+        self.sync_watches()
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        with self.cond:
+            self.cond.notify()
+
+    def sync_watches(self):
+        roots = load_roots()
+        with self.lock:
+            for root in roots:
+                if root not in self.watches and os.path.isdir(root):
+                    self.watches[root] = self.observer.schedule(self.handler, root, recursive=True)
+                    print(f"[Index] Watching {root}")
+            for root in [r for r in self.watches if r not in roots]:
+                self.observer.unschedule(self.watches.pop(root))
+                self.shards.pop(root, None)
+            self.roots = roots
+
+    # --- Events ---
+    def queue(self, kind, path, dest=None, is_dir=False):
+        if kind == "move":
+            # Partial downloads renamed into place are new files, not renames
+            if is_ignored(path) and is_ignored(dest):
+                return
+            if is_ignored(dest):
+                kind, dest = "remove", None
+            elif is_ignored(path):
+                kind, path, dest = ("scan" if is_dir else "upsert"), dest, None
+        elif is_ignored(path):
+            return
+
+        with self.cond:
+            if kind == "upsert":
+                # Event storms on one file collapse into a single update
+                if path in self.pending_upserts:
+                    return
+                self.pending_upserts.add(path)
+            else:
+                # Keep later upserts ordered after this move or remove
+                self.pending_upserts.clear()
+            now = time.monotonic()
+            if not self.pending:
+                self.first_event = now
+            self.last_event = now
+            self.pending.append((kind, path, dest, is_dir))
+            self.cond.notify()
+
+    def next_batch(self):
+        with self.cond:
+            while not self.pending and not self.stopping.is_set():
+                self.cond.wait()
+            while not self.stopping.is_set():
+                deadline = min(self.last_event + QUIET_PERIOD, self.first_event + MAX_DELAY)
+                if deadline <= time.monotonic():
+                    break
+                self.cond.wait(deadline - time.monotonic())
+            if embedding_running.is_set():
+                return None
+            batch = self.pending[:BATCH_SIZE]
+            del self.pending[:BATCH_SIZE]
+            self.pending_upserts.clear()
+            if not self.pending:
+                self.first_event = None
+            return batch
+
+    def run(self):
+        while not self.stopping.is_set():
+            batch = self.next_batch()
+            if batch is None:
+                # embed_root owns the shard files during a run, hold changes until it ends
+                self.stopping.wait(QUIET_PERIOD)
+                continue
+            if not batch:
+                continue
+            try:
+                self.apply(batch)
+            except Exception as e:
+                print(f"[Index] Failed to apply {len(batch)} changes: {e}")
+
+    # --- Applying ---
+    def root_of(self, path):
+        matches = [r for r in self.roots if path.startswith(r.rstrip(os.sep) + os.sep)]
+        return max(matches, key=len) if matches else None
+
+    def state_for(self, path):
+        root = self.root_of(path)
+        if root is None:
+            return None
+        state = self.shards.get(root)
+        stamp = ShardState.disk_stamp(root)
+        if stamp is None:
+            return None
+        if state is None or state.stamp != stamp:
+            # First use, or an embedding run rewrote the shard since
+            state = ShardState(root)
+            if state.file_index.ntotal != len(state.file_metadata) or \
+                    any("hash" not in e for e in state.file_metadata):
+                print(f"[Index] Shard for {root} predates content hashes or is inconsistent, "
+                      f"waiting for a full run")
+                return None
+            self.shards[root] = state
+        return state
+
+    def embed(self, path):
+        try:
+            text = extract_text(path)
+            if not text.strip():
+                return None
+            return fe._embed_text_sync(text, DEFAULT_BATCH_SIZE, cancel_event=self.stopping)
+        except Exception as e:
+            print(f"[Index] Failed to embed {path}: {e}")
+            return None
+
+    def apply(self, batch):
+        store = get_store()
+        upserts = {}
+        with self.lock:
+            for kind, path, dest, is_dir in batch:
+                if kind == "upsert":
+                    upserts[path] = None
+                elif kind == "scan":
+                    upserts.update((p, None) for p in fe.list_files(path) if not is_ignored(p))
+                elif kind == "remove":
+                    state = self.state_for(path)
+                    if state:
+                        state.remove(path, is_dir)
+                elif kind == "move":
+                    self.move(path, dest, is_dir, upserts)
+
+            # Upserts are resolved against the disk as it is now, after every move
+            existing = {p for p in upserts if os.path.isfile(p)}
+            known = {}
+            for path in upserts:
+                state = self.state_for(path)
+                if not state:
+                    continue
+                if path not in existing:
+                    state.remove(path, False)
+                elif top_folder(state.root, path) is not None:
+                    record = state.hashed.get(path)
+                    known[path] = (state, record["hash"] if record else None)
+
+        # Hashing and embedding are the slow part, sync_watches must not wait on them
+        changed = []
+        for path, content_hash in hash_files(list(known)).items():
+            state, known_hash = known[path]
+            if content_hash == known_hash:
+                continue
+            vector = store.get(content_hash)
+            if vector is None:
+                result = self.embed(path)
+                if result is not None:
+                    vector, n_chunks = result
+                    store.put(content_hash, vector, chunks=n_chunks)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            changed.append((state, path, content_hash, size, vector))
+
+        with self.lock:
+            for state, path, content_hash, size, vector in changed:
+                # Skipped if the root stopped being watched in the meantime
+                if self.shards.get(state.root) is state:
+                    state.upsert(path, content_hash, size, vector)
+
+            if embedding_running.is_set():
+                # A run started meanwhile and re-reads the disk anyway, drop the half-applied state
+                self.shards.clear()
+                return
+
+            updates = []
+            for root, state in self.shards.items():
+                if state.changed:
+                    counts = state.commit(store)
+                    print(f"[Index] {root}: +{counts['added']} ~{counts['updated']} "
+                          f"-{counts['removed']} >{counts['renamed']}")
+                    updates.append({"root": root, "files": len(state.file_metadata), **counts})
+
+        if updates and self.loop and self.broadcast_callback:
+            asyncio.run_coroutine_threadsafe(
+                self.broadcast_callback({"action": "index_updated", "roots": updates}),
+                self.loop
+            )
+
+    def move(self, src, dst, is_dir, upserts):
+        for path in [p for p in upserts if p == src or p.startswith(src + os.sep)]:
+            del upserts[path]
+            upserts[dst + path[len(src):]] = None
+
+        src_state = self.state_for(src)
+        dst_root = self.root_of(dst)
+        if src_state and src_state.root == dst_root and (is_dir or src_state.knows(src)):
+            src_state.rename(src, dst, is_dir)
+            return
+        # Across roots, or in from an unindexed place: content hashes make re-adding cheap
+        if src_state:
+            src_state.remove(src, is_dir)
+        if dst_root:
+            paths = fe.list_files(dst) if is_dir else [dst]
+            upserts.update((p, None) for p in paths if not is_ignored(p))
+
+
+_maintainer = None
+
+
+def start_maintainer(observer, loop=None, broadcast_callback=None):
+    global _maintainer
+    _maintainer = IndexMaintainer(observer, loop, broadcast_callback)
+    _maintainer.start()
+    return _maintainer
+
+
+def refresh_watches():
+    # Called after roots are added or removed
+    if _maintainer is not None:
+        _maintainer.sync_watches()
@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from catalog import drop_root
+
+# --- Config ---
+ROOTS_CONFIG_FILE = "index_roots.json"
+SHARDS_DIR = "shards"
+DEFAULT_ROOTS = ["~/Desktop"]
+
+# Single flat index written by earlier versions, always built from ~/Desktop
+LEGACY_ROOT = "~/Desktop"
+LEGACY_FILES = {
+    "file_index": "file_index.faiss",
+    "file_metadata": "file_metadata.jsonl",
+    "folder_index": "folder_index.faiss",
+    "folder_metadata": "folder_metadata.jsonl",
+}
+
+
+def normalize_root(path):
+    return os.path.abspath(os.path.expanduser(path))
+
+
+def overlapping_root(root, roots):
+    """
+    The configured root that root lies inside or contains, if any. Overlapping
+    roots would index files twice, fight over catalog rows, and let grouping
+    the outer root move the inner one.
+    """
+    for other in roots:
+        if other == root:
+            continue
+        if root.startswith(other.rstrip(os.sep) + os.sep) or other.startswith(root.rstrip(os.sep) + os.sep):
+            return other
+    return None
+
+
+def load_roots():
+    if not os.path.exists(ROOTS_CONFIG_FILE):
+        return [normalize_root(p) for p in DEFAULT_ROOTS]
+    with open(ROOTS_CONFIG_FILE, "r") as f:
+        roots = json.load(f)
+    seen = []
+    for root in roots:
+        root = normalize_root(root)
+        if root in seen:
+            continue
+        other = overlapping_root(root, seen)
+        if other:
+            print(f"Ignoring root {root}, it overlaps {other}")
+            continue
+        seen.append(root)
+    return seen
+
+
+def save_roots(roots):
+    with open(ROOTS_CONFIG_FILE, "w") as f:
+        json.dump([normalize_root(r) for r in roots], f, indent=2)
+
+
+def add_root(path):
+    root = normalize_root(path)
+    if not os.path.isdir(root):
+        raise ValueError(f"Not a directory: {root}")
+    roots = load_roots()
+    other = overlapping_root(root, roots)
+    if other:
+        raise ValueError(f"{root} overlaps the indexed root {other}")
+    if root not in roots:
+        roots.append(root)
+        save_roots(roots)
+    return roots
+
+
+def remove_root(path, drop_index=True):
+    root = normalize_root(path)
+    roots = [r for r in load_roots() if r != root]
+    save_roots(roots)
+    if drop_index:
+        drop_shard(root)
+    return roots
+
+
+def shard_id(root):
+    root = normalize_root(root)
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", os.path.basename(root) or "root")
+    digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:8]
+    return f"{slug}-{digest}"
+
+
+def shard_paths(root):
+    shard_dir = os.path.join(SHARDS_DIR, shard_id(root))
+    return {
+        "dir": shard_dir,
+        "file_index": os.path.join(shard_dir, "file_index.faiss"),
+        "file_metadata": os.path.join(shard_dir, "file_metadata.jsonl"),
+        "folder_index": os.path.join(shard_dir, "folder_index.faiss"),
+        "folder_metadata": os.path.join(shard_dir, "folder_metadata.jsonl"),
+        "file_hashes": os.path.join(shard_dir, "file_hashes.jsonl"),
+        "manifest": os.path.join(shard_dir, "manifest.json"),
+    }
+
+
+def ensure_shard(root):
+    paths = shard_paths(root)
+    os.makedirs(paths["dir"], exist_ok=True)
+    return paths
+
+
+def drop_shard(root):
+    shard_dir = shard_paths(root)["dir"]
+    if os.path.isdir(shard_dir):
+        shutil.rmtree(shard_dir)
+        print(f"Dropped index shard for {root}")
+    drop_root(normalize_root(root))
+
+
+def read_manifest(root):
+    path = shard_paths(root)["manifest"]
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_manifest(root, file_count, folder_count, **extra):
+    paths = ensure_shard(root)
+    manifest = {
+        "root": normalize_root(root),
+        "shard": shard_id(root),
+        "files": file_count,
+        "folders": folder_count,
+        "updated": datetime.now().isoformat(),
+        **extra
+    }
+    tmp_path = paths["manifest"] + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, paths["manifest"])
+    return manifest
+
+
+def migrate_legacy_index():
+    """
+    Move a flat index from before sharding into the ~/Desktop shard,
+    so existing users keep their embeddings.
+    """
+    legacy = {k: v for k, v in LEGACY_FILES.items() if os.path.exists(v)}
+    if not legacy:
+        return
+    root = normalize_root(LEGACY_ROOT)
+    paths = shard_paths(root)
+    if os.path.isdir(paths["dir"]):
+        return
+    os.makedirs(paths["dir"])
+    for key, legacy_path in legacy.items():
+        shutil.move(legacy_path, paths[key])
+    print(f"Migrated legacy index into shard {shard_id(root)}")
@@ -17,9 +17,24 @@ def init_db():
             timestamp TEXT
         )
     """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_path ON files (path)")
     conn.commit()
     conn.close()
 
+def logged_paths(paths, batch_size=500):
+    # Which of these paths already have a row, looked up through idx_files_path
+    paths = list(paths)
+    found = set()
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    for i in range(0, len(paths), batch_size):
+        batch = paths[i:i + batch_size]
+        placeholders = ",".join("?" * len(batch))
+        c.execute(f"SELECT DISTINCT path FROM files WHERE path IN ({placeholders})", batch)
+        found.update(row[0] for row in c.fetchall())
+    conn.close()
+    return found
+
 def log_file(filename, path, filetype, category, summary):
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
@@ -2,15 +2,27 @@ import time
 import os
 import shutil
 import asyncio
+import itertools
+import threading
+from queue import PriorityQueue
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from extractor import extract_text
-from classifier import classify_text
+from classifier import classify_with_candidates
 from socket_server import start_socket_server, broadcast
-from logger import init_db, log_file
-from shared_llm import llm
+from logger import init_db, log_file, logged_paths
+from index_roots import migrate_legacy_index
+from catalog import init_catalog
+from index_maintainer import start_maintainer
+from group_folders_faiss import resume_interrupted
+from shared_llm import llm, llm_lock
 
 DOWNLOADS_FOLDER = os.path.expanduser("~/Downloads")
+CLASSIFY_WORKERS = 4
+
+# Live events always run before anything found by the startup catch-up scan
+LIVE_PRIORITY = 0
+CATCHUP_PRIORITY = 1
 
 
 def summarize_with_llm(text, filename=""):
@@ -40,7 +52,8 @@ def summarize_with_llm(text, filename=""):
     print("Prompt preview:", prompt[:300])
 
     try:
-        output = llm(prompt, max_tokens=200, stop=["###"])
+        with llm_lock:
+            output = llm(prompt, max_tokens=200, stop=["###"])
         summary = output["choices"][0]["text"].strip()
 
         if not summary:
@@ -54,70 +67,168 @@ def summarize_with_llm(text, filename=""):
         return "LLM summarization failed."
 
 
-class FileHandler(FileSystemEventHandler):
-    def __init__(self, loop):
+def should_process(path):
+    filename = os.path.basename(path)
+    ext = os.path.splitext(filename)[1].lower()
+    return not (filename.startswith('.') or ext in ('.crdownload', '.part', ''))
+
+
+def process_file(path, loop):
+    filename = os.path.basename(path)
+    ext = os.path.splitext(filename)[1].lower()
+
+    content = extract_text(path)
+    category, candidates = classify_with_candidates(content)
+
+    try:
+        summary = summarize_with_llm(content, filename)
+    except Exception as e:
+        print("LLM summarization failed, fallback:", e)
+        summary = content.strip().replace('\n', ' ')[:300] + "..."
+
+    log_file(
+        filename=filename,
+        path=path,
+        filetype=ext,
+        category=category,
+        summary=summary
+    )
+
+    print(f"[Broadcast] {filename} → {category}")
+
+    asyncio.run_coroutine_threadsafe(
+        broadcast({
+            "filename": filename,
+            "category": category,
+            "candidates": candidates,
+            "path": path,
+            "summary": summary
+        }),
+        loop
+    )
+
+    target_folder = os.path.join(DOWNLOADS_FOLDER, category)
+    os.makedirs(target_folder, exist_ok=True)
+    # Optional: move file to categorized folder
+
+
+class ClassificationQueue:
+    """
+    Priority queue drained by a pool of worker threads.
+    Live events jump ahead of catch-up work; catch-up runs newest first.
+    """
+
+    def __init__(self, loop, workers=CLASSIFY_WORKERS):
         self.loop = loop
+        self.queue = PriorityQueue()
+        self.counter = itertools.count()
+        self.pending = {}  # path -> priority of its live queue entry
+        self.lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self.worker, name=f"classifier-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+
+    def put(self, path, priority=LIVE_PRIORITY, order=0):
+        with self.lock:
+            queued = self.pending.get(path)
+            # Already queued at this priority or better; a live event for a file
+            # the catch-up scan queued is re-queued ahead and the old entry skipped
+            if queued is not None and queued <= priority:
+                return
+            self.pending[path] = priority
+        self.queue.put((priority, order, next(self.counter), path))
+
+    def worker(self):
+        while True:
+            priority, _, _, path = self.queue.get()
+            with self.lock:
+                stale = self.pending.get(path) != priority
+                if not stale:
+                    del self.pending[path]
+            if stale:
+                self.queue.task_done()
+                continue
+            try:
+                if priority == LIVE_PRIORITY:
+                    time.sleep(1)  # wait for file write to finish
+                if os.path.exists(path):
+                    process_file(path, self.loop)
+            except Exception as e:
+                print(f"[Classifier] Failed to process {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+
+class FileHandler(FileSystemEventHandler):
+    def __init__(self, classify_queue):
+        self.classify_queue = classify_queue
 
     def on_created(self, event):
         print(f"[FileWatcher] New file created: {event.src_path}")
-        if not event.is_directory:
-            filename = os.path.basename(event.src_path)
-            ext = os.path.splitext(filename)[1].lower()
+        if not event.is_directory and should_process(event.src_path):
+            self.classify_queue.put(event.src_path, LIVE_PRIORITY)
 
-            if filename.startswith('.') or ext in ('.crdownload', '.part', ''):
-                return
 
-            time.sleep(1)  # wait for file write to finish
+def catch_up_scan(classify_queue, folder=DOWNLOADS_FOLDER):
+    """
+    Queues files that arrived while the organiser was not running,
+    i.e. files in the folder with no row in the files log.
+    """
+    candidates = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file() and should_process(entry.path):
+                try:
+                    candidates.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
 
-            content = extract_text(event.src_path)
-            category = classify_text(content)
+    known = logged_paths(path for _, path in candidates)
+    missing = [(mtime, path) for mtime, path in candidates if path not in known]
 
-            try:
-                summary = summarize_with_llm(content, filename)
-            except Exception as e:
-                print("LLM summarization failed, fallback:", e)
-                summary = content.strip().replace('\n', ' ')[:300] + "..."
-
-            log_file(
-                filename=filename,
-                path=event.src_path,
-                filetype=ext,
-                category=category,
-                summary=summary
-            )
-
-            print(f"[Broadcast] {filename} → {category}")
-
-            asyncio.run_coroutine_threadsafe(
-                broadcast({
-                    "filename": filename,
-                    "category": category,
-                    "path": event.src_path,
-                    "summary": summary
-                }),
-                self.loop
-            )
-
-            target_folder = os.path.join(DOWNLOADS_FOLDER, category)
-            os.makedirs(target_folder, exist_ok=True)
-            # Optional: move file to categorized folder
+    for mtime, path in missing:
+        classify_queue.put(path, CATCHUP_PRIORITY, order=-mtime)
+
+    print(f"[CatchUp] Queued {len(missing)} unprocessed files from {folder}")
+    return len(missing)
 
 
 async def main():
     init_db()
+    init_catalog()
+    migrate_legacy_index()
     await start_socket_server()
     print("WebSocket server started")
 
     loop = asyncio.get_running_loop()
 
+    classify_queue = ClassificationQueue(loop)
+    classify_queue.start()
+
     observer = Observer()
-    handler = FileHandler(loop)
+    handler = FileHandler(classify_queue)
     observer.schedule(handler, path=DOWNLOADS_FOLDER, recursive=False)
+    # Recursive watches on every indexed root keep the shards current
+    maintainer = start_maintainer(observer, loop, broadcast)
     observer.start()
 
+    # A grouping or undo cut short by a crash is finished from its journal
+    resumed, errors = await resume_interrupted()
+    if resumed:
+        print(f"[Journal] Finished {resumed} interrupted folder moves, {len(errors)} failed")
+
+    # Observer is already running, so nothing arriving during the scan is missed
+    await asyncio.to_thread(catch_up_scan, classify_queue)
+
     try:
         await asyncio.Future()
     except KeyboardInterrupt:
+        maintainer.stop()
         observer.stop()
     observer.join()
 
@@ -0,0 +1,82 @@
+import gc
+import time
+import psutil
+import torch
+
+# --- Config ---
+DEFAULT_BATCH_SIZE = 8
+MAX_BATCH_SIZE = 32
+DEFAULT_READ_AHEAD = 2
+MAX_READ_AHEAD = 8
+HIGH_WATER = 0.9
+LOW_WATER = 0.6
+RELIEF_INTERVAL = 5.0
+
+_process = psutil.Process()
+
+
+def current_rss(include_children=False):
+    rss = _process.memory_info().rss
+    if include_children:
+        for child in _process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                continue
+    return rss
+
+
+def release_device_memory():
+    if torch.backends.mps.is_available():
+        torch.mps.empty_cache()
+    elif torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class MemoryBudget:
+    """
+    Keeps an embedding run under an RSS budget by adapting the inference
+    batch size and the extraction read-ahead depth. Without a budget the
+    defaults are used as-is and only the peak is tracked.
+    """
+
+    def __init__(self, budget_mb=None, include_children=False):
+        self.budget = budget_mb * 1024 * 1024 if budget_mb else None
+        self.include_children = include_children
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.read_ahead = DEFAULT_READ_AHEAD
+        self.peak = current_rss(include_children)
+        self.last_relief = 0.0
+
+    def sample(self):
+        rss = current_rss(self.include_children)
+        self.peak = max(self.peak, rss)
+        if self.budget is None:
+            return rss
+
+        if rss > self.budget * HIGH_WATER:
+            # Back off fast, recover slowly
+            self.batch_size = max(1, self.batch_size // 2)
+            self.read_ahead = max(0, self.read_ahead // 2)
+            self.relieve()
+        elif rss < self.budget * LOW_WATER:
+            self.batch_size = min(MAX_BATCH_SIZE, self.batch_size + 1)
+            self.read_ahead = min(MAX_READ_AHEAD, self.read_ahead + 1)
+        return rss
+
+    def relieve(self):
+        # Full collections are slow on a large heap, only run them when over budget
+        now = time.monotonic()
+        if now - self.last_relief < RELIEF_INTERVAL:
+            return
+        self.last_relief = now
+        gc.collect()
+        release_device_memory()
+
+    def summary(self):
+        return {
+            "peak_rss_mb": round(self.peak / (1024 * 1024), 1),
+            "budget_mb": round(self.budget / (1024 * 1024)) if self.budget else None,
+            "batch_size": self.batch_size,
+            "read_ahead": self.read_ahead
+        }
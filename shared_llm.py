@@ -1,7 +1,33 @@
-from llama_cpp import Llama
+import threading
 
-llm = Llama(
-    model_path="./models/phi-2.Q2_K.gguf",
+LLM_MODEL_PATH = "./models/phi-2.Q2_K.gguf"
+
+
+class LazyLlama:
+    """
+    Loads the model on first call. Embedding worker processes re-import the
+    main module's imports, and must not each load a copy of the LLM.
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.model = None
+        self.load_lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        if self.model is None:
+            with self.load_lock:
+                if self.model is None:
+                    from llama_cpp import Llama
+                    self.model = Llama(**self.kwargs)
+        return self.model(*args, **kwargs)
+
+
+llm = LazyLlama(
+    model_path=LLM_MODEL_PATH,
     n_ctx=2048,
-    n_threads=4 
-)
\ No newline at end of file
+    n_threads=4
+)
+
+# llama.cpp contexts are not thread-safe, serialize every call through this lock
+llm_lock = threading.Lock()
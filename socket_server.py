@@ -7,13 +7,18 @@ from group_folders_faiss import group_folders_from_faiss, undo_grouping
 from shared_llm import llm
 from folder_embed_and_classify import embed_folders_and_files
 from embedding_state import embedding_cancel_event
+from broadcast_hub import BroadcastHub
+from index_roots import load_roots, add_root, remove_root, read_manifest
+from content_store import find_duplicates
+from embed_checkpoint import load_checkpoint
+from index_maintainer import refresh_watches
 
-connected_clients = set()
+hub = BroadcastHub()
 embedding_task = None  # Global handle to the current embedding task
 
 async def handler(websocket):
     global embedding_task
-    connected_clients.add(websocket)
+    hub.register(websocket)
     try:
         async for message in websocket:
             data = json.loads(message)
@@ -24,17 +29,20 @@ async def handler(websocket):
                 try:
                     async for update in group_folders_from_faiss(4, llm, progress_callback=send_progress):
                         if update.get("final"):
-                            await websocket.send(json.dumps({
+                            hub.send(websocket, {
                                 "action": "group_result",
-                                "status": "success",
-                                "groups": update["groups"]
-                            }))
+                                "status": "partial" if update["conflicts"] or update["errors"] else "success",
+                                "groups": update["groups"],
+                                "resumed": update.get("resumed", 0),
+                                "conflicts": update["conflicts"],
+                                "errors": update["errors"]
+                            })
                 except Exception as e:
-                    await websocket.send(json.dumps({
+                    hub.send(websocket, {
                         "action": "group_result",
                         "status": "error",
                         "message": str(e)
-                    }))
+                    })
                 continue
 
             response = {"action": "status", "status": "", "path": data.get("path")}
@@ -57,32 +65,31 @@ async def handler(websocket):
                 response["status"] = "skipped"
 
             elif action == "undo_grouping":
-                try:
-                    await websocket.send(json.dumps({
-                        "action": "undo_result",
-                        "status": "started"
-                    }))
-                except:
-                    pass
+                hub.send(websocket, {
+                    "action": "undo_result",
+                    "status": "started"
+                })
 
                 try:
-                    await undo_grouping()
-                    await websocket.send(json.dumps({
-                        "action": "undo_result",
-                        "status": "success"
-                    }))
+                    result = await undo_grouping(progress_callback=send_progress)
+                    hub.send(websocket, {"action": "undo_result", **result})
                 except Exception as e:
-                    await websocket.send(json.dumps({
+                    hub.send(websocket, {
                         "action": "undo_result",
                         "status": "error",
                         "message": str(e)
-                    }))
+                    })
                 continue
 
-            elif action == "start_embedding":
-                print("Start embedding received")
+            elif action in ("start_embedding", "resume_embedding"):
+                print(f"{action} received")
                 if embedding_task and not embedding_task.done():
-                    await websocket.send(json.dumps({"action": "embed_already_running"}))
+                    hub.send(websocket, {"action": "embed_already_running"})
+                    continue
+
+                resume = action == "resume_embedding"
+                if resume and load_checkpoint() is None:
+                    hub.send(websocket, {"action": "embed_nothing_to_resume"})
                     continue
 
                 try:
@@ -90,16 +97,63 @@ async def handler(websocket):
                 except Exception:
                     pass
 
+                # Optional subset of roots to re-index, other shards are left untouched
                 embedding_task = asyncio.create_task(
                     embed_folders_and_files(
-                        os.path.expanduser("~/Desktop"),
+                        data.get("roots"),
                         progress_callback=send_progress,
-                        broadcast_callback=broadcast
+                        broadcast_callback=broadcast,
+                        resume=resume,
+                        memory_budget_mb=data.get("memory_budget_mb"),
+                        workers=data.get("workers")
                     )
                 )
 
                 asyncio.create_task(wait_for_embedding_completion(websocket))
-                await websocket.send(json.dumps({"action": "embed_started"}))
+                hub.send(websocket, {"action": "embed_started", "resumed": resume})
+                continue
+
+            elif action == "duplicates":
+                try:
+                    groups = await asyncio.to_thread(find_duplicates)
+                    hub.send(websocket, {
+                        "action": "duplicates_result",
+                        "status": "success",
+                        "groups": groups,
+                        "wasted_bytes": sum(g["wasted_bytes"] for g in groups)
+                    })
+                except Exception as e:
+                    hub.send(websocket, {
+                        "action": "duplicates_result",
+                        "status": "error",
+                        "message": str(e)
+                    })
+                continue
+
+            elif action == "list_roots":
+                hub.send(websocket, {
+                    "action": "roots",
+                    "roots": roots_payload(load_roots())
+                })
+                continue
+
+            elif action in ("add_root", "remove_root"):
+                if embedding_task and not embedding_task.done():
+                    hub.send(websocket, {"action": "embed_already_running"})
+                    continue
+                try:
+                    if action == "add_root":
+                        roots = add_root(data["path"])
+                    else:
+                        roots = remove_root(data["path"], drop_index=data.get("drop_index", True))
+                    await asyncio.to_thread(refresh_watches)
+                    hub.send(websocket, {
+                        "action": "roots",
+                        "status": "success",
+                        "roots": roots_payload(roots)
+                    })
+                except Exception as e:
+                    hub.send(websocket, {"action": "roots", "status": "error", "message": str(e)})
                 continue
 
             elif action == "stop_embedding":
@@ -111,58 +165,51 @@ async def handler(websocket):
 
                 if embedding_task and not embedding_task.done():
                     embedding_task.cancel()
-                    await websocket.send(json.dumps({"action": "embed_stopping"}))
+                    hub.send(websocket, {"action": "embed_stopping"})
                 else:
-                    await websocket.send(json.dumps({"action": "embed_not_running"}))
+                    hub.send(websocket, {"action": "embed_not_running"})
                 continue
 
-            await websocket.send(json.dumps(response))
+            hub.send(websocket, response)
 
     except websockets.exceptions.ConnectionClosed:
         print("Client disconnected")
     finally:
-        connected_clients.discard(websocket)
+        hub.unregister(websocket)
 
 async def wait_for_embedding_completion(websocket):
     global embedding_task
     try:
         await embedding_task
-        try:
-            await websocket.send(json.dumps({"action": "embed_complete", "status": "success"}))
-        except Exception:
-            pass
+        hub.send(websocket, {"action": "embed_complete", "status": "success"})
     except asyncio.CancelledError:
         print("Embedding task cancelled")
-        try:
-            await websocket.send(json.dumps({"action": "embed_stopped"}))
-        except Exception:
-            pass
+        hub.send(websocket, {"action": "embed_stopped"})
     except Exception as e:
         print(f"Embedding task error: {e}")
-        try:
-            await websocket.send(json.dumps({
-                "action": "embed_complete",
-                "status": "error",
-                "message": str(e)
-            }))
-        except Exception:
-            pass
+        hub.send(websocket, {
+            "action": "embed_complete",
+            "status": "error",
+            "message": str(e)
+        })
     finally:
         embedding_task = None
 
-async def send_progress(done, total):
-    if connected_clients:
-        msg = json.dumps({
-            "action": "embed_progress",
-            "done": done,
-            "total": total
-        })
-        await asyncio.gather(*(client.send(msg) for client in connected_clients), return_exceptions=True)
+def roots_payload(roots):
+    return [{"path": r, "manifest": read_manifest(r)} for r in roots]
+
+async def send_progress(done, total, **stats):
+    # Coalesced and rate-limited per client by the hub, never blocks the caller
+    hub.publish_progress({
+        "action": "embed_progress",
+        "done": done,
+        "total": total,
+        **stats
+    })
 
 async def broadcast(file_info):
-    if connected_clients:
-        msg = json.dumps(file_info)
-        await asyncio.gather(*(client.send(msg) for client in connected_clients), return_exceptions=True)
+    # File cards carry no action and are the only broadcasts a slow client may miss
+    hub.publish(file_info, droppable="action" not in file_info)
 
 def start_socket_server():
     return websockets.serve(handler, "localhost", 8765)
@@ -0,0 +1,66 @@
+import importlib
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+faiss = pytest.importorskip("faiss")
+sentence_transformers = pytest.importorskip("sentence_transformers")
+
+
+class FakeModel:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def encode(self, content):
+        return np.array([1.0, 0.0, 0.0, 0.0], dtype="float32")
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    # Keep the test offline: the real model is downloaded on import
+    monkeypatch.setattr(sentence_transformers, "SentenceTransformer", FakeModel)
+    sys.modules.pop("classifier", None)
+    module = importlib.import_module("classifier")
+    yield module
+    sys.modules.pop("classifier", None)
+
+
+def test_classify_ranked_uses_folder_candidates(classifier, monkeypatch):
+    folder_index = faiss.IndexFlatL2(4)
+    folder_index.add(np.array([[1, 0, 0, 0]], dtype="float32"))
+    folder_shard = {"index": folder_index, "metadata": [{"path": "/r/Docs"}]}
+
+    vectors = np.array([[1, 0, 0, 0], [0.9, 0.1, 0, 0]], dtype="float32")
+    file_shard = {
+        "metadata": [
+            {"path": "/r/Docs/Reports/a.txt", "root_folder": "/r/Docs"},
+            {"path": "/r/Docs/Reports/b.txt", "root_folder": "/r/Docs"},
+        ],
+        "vectors": vectors,
+        "rows": {"/r/Docs": np.array([0, 1], dtype="int64")},
+    }
+
+    monkeypatch.setattr(classifier, "load_roots", lambda: ["/r"])
+    monkeypatch.setattr(
+        classifier, "load_shard",
+        lambda root, kind="file": folder_shard if kind == "folder" else file_shard
+    )
+    # Row 0 was moved by a grouping since it was indexed
+    monkeypatch.setattr(
+        classifier, "current_paths",
+        lambda root, ids, table="files": {0: "/r/Work/Docs/Reports/a.txt"}
+    )
+
+    ranked = classifier.classify_ranked("quarterly report")
+
+    assert [r["category"] for r in ranked] == ["/r/Work/Docs/Reports", "/r/Docs/Reports"]
+    assert ranked[0]["confidence"] > ranked[1]["confidence"]
+
+
+def test_low_confidence_falls_back_to_uncategorized(classifier, monkeypatch):
+    ranked = [{"category": "/r/Docs", "confidence": classifier.MIN_CONFIDENCE / 2}]
+    monkeypatch.setattr(classifier, "classify_ranked", lambda content: ranked)
+
+    assert classifier.classify_with_candidates("memo") == ("Uncategorized", ranked)
+    assert classifier.classify_text("memo") == "Uncategorized"